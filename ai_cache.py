@@ -0,0 +1,71 @@
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AdviceCache:
+    """
+    Сохранённые в SQLite AI-советы по ключу (карта, положение, знак зодиака).
+    На каждый ключ хранится до variants разных текстов, чтобы пользователи с одинаковой
+    картой не получали один и тот же совет. Текст старше ttl считается устаревшим
+    и при следующем обращении генерируется заново (ротация).
+    """
+
+    def __init__(self, db, variants: int = 3, ttl: float = 30 * 24 * 3600):
+        self.db = db
+        self.variants = max(1, variants)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(card, is_reversed, zodiac_sign):
+        return card, int(bool(is_reversed)), zodiac_sign or ''
+
+    def pick_variant(self):
+        return random.randrange(self.variants)
+
+    async def get(self, key, variant):
+        row = await self.db.fetchone(
+            "SELECT text, created_at FROM ai_advice_cache "
+            "WHERE card = ? AND is_reversed = ? AND zodiac_sign = ? AND variant = ?",
+            (*key, variant)
+        )
+        if row is None:
+            self.misses += 1
+            return None
+        text, created_at = row
+        if self.ttl and time.time() - created_at > self.ttl:
+            self.expired += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    async def put(self, key, variant, text):
+        await self.db.execute(
+            "INSERT OR REPLACE INTO ai_advice_cache (card, is_reversed, zodiac_sign, variant, text, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, variant, text, int(time.time()))
+        )
+
+    async def count(self):
+        row = await self.db.fetchone(
+            "SELECT COUNT(*) FROM ai_advice_cache WHERE created_at >= ?",
+            (int(time.time() - self.ttl) if self.ttl else 0,)
+        )
+        return row[0]
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return (
+            f"попаданий {self.hits}, промахов {self.misses} (из них устаревших {self.expired}), "
+            f"доля попаданий {self.hit_rate:.0%}"
+        )
@@ -0,0 +1,145 @@
+"""
+Локальный стенд OpenAI-совместимого API для проверки AI-советов без сети.
+
+Отвечает на POST .../chat/completions текстом-заглушкой с заданной задержкой.
+С "stream": true отдаёт ответ по кускам в формате SSE (chat.completion.chunk), как настоящий API.
+Запуск: python ai_stub_server.py --port 8089 --latency 1.5
+Затем: AI_BASE_URL=http://127.0.0.1:8089/v1 python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from mini_http import serve, write_response, write_chunk_headers, write_chunk
+
+
+class StubAIServer:
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, fail_rate: float = 0.0,
+                 chunk_delay: float = 0.05, reply_length: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        # Пауза между кусками потокового ответа и минимальная длина ответа (для проверки длинных текстов)
+        self.chunk_delay = chunk_delay
+        self.reply_length = reply_length
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.port = None
+        self._server = None
+
+    def _delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _reply_text(self, payload):
+        user_message = next(
+            (m.get('content', '') for m in reversed(payload.get('messages', [])) if m.get('role') == 'user'), ''
+        )
+        first_line = user_message.split('\n', 1)[0]
+        text = f"🔮 Совет стенда ({first_line}): прислушайтесь к себе сегодня ✨"
+        while len(text) < self.reply_length:
+            text += "\n\n🌙 Звёзды советуют не спешить и замечать маленькие знаки дня."
+        return text
+
+    async def _stream(self, writer, payload, text):
+        base = {
+            'id': f"stub-{self.requests}",
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+        }
+
+        def event(delta, finish_reason=None):
+            chunk = dict(base, choices=[{'index': 0, 'delta': delta, 'finish_reason': finish_reason}])
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        write_chunk_headers(writer)
+        write_chunk(writer, event({'role': 'assistant', 'content': ''}))
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            write_chunk(writer, event({'content': word if i == 0 else ' ' + word}))
+            await writer.drain()
+            await asyncio.sleep(self.chunk_delay)
+        write_chunk(writer, event({}, 'stop'))
+        write_chunk(writer, b"data: [DONE]\n\n")
+        write_chunk(writer, b'')
+
+    async def handle(self, request, writer):
+        if request.method != 'POST' or not request.path.rstrip('/').endswith('/chat/completions'):
+            write_response(writer, 404, {'error': {'message': 'not found'}})
+            return
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            payload = request.json()
+            await asyncio.sleep(self._delay())
+            if random.random() < self.fail_rate:
+                write_response(writer, 503, {'error': {'message': 'stub overloaded', 'type': 'server_error'}})
+                return
+            text = self._reply_text(payload)
+            if payload.get('stream'):
+                await self._stream(writer, payload, text)
+                return
+            prompt_tokens = sum(len(m.get('content', '')) for m in payload.get('messages', [])) // 4
+            completion_tokens = len(text) // 4
+            write_response(writer, 200, {
+                'id': f"stub-{self.requests}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': payload.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': text},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                },
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await serve(self.handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _main(args):
+    server = StubAIServer(latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+                          chunk_delay=args.chunk_delay, reply_length=args.reply_length)
+    await server.start(args.host, args.port)
+    print(f"Стенд AI слушает {server.base_url} (задержка {args.latency} с)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help="пауза между кусками потокового ответа (с)")
+    parser.add_argument('--reply-length', type=int, default=0, help="минимальная длина ответа в символах")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,21 +1,198 @@
+import asyncio
+import logging
 import os
+import statistics
+import time
+from collections import Counter, deque
+
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from ai_cache import AdviceCache
+from config import (
+    AI_BASE_URL, AI_MODEL, AI_TIMEOUT, AI_MAX_CONCURRENCY, AI_MAX_CONNECTIONS,
+    AI_LATENCY_BUDGET, AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN, AI_HEDGE, AI_HEDGE_MIN_SAMPLES
+)
+
+logger = logging.getLogger(__name__)
 
 # Загружаем переменные из .env
 load_dotenv()
 
-# Подключаемся к Langdock API
-client = OpenAI(
-    base_url="https://api.langdock.com/openai/eu/v1",
-    api_key=os.getenv("LANGDOCK_API_KEY")  # ✅ Имя переменной такое же как в .env
+# Подключаемся к Langdock API асинхронным клиентом с общим пулом соединений.
+# AI_BASE_URL из окружения позволяет направить запросы на локальный стенд (ai_stub_server.py).
+client = AsyncOpenAI(
+    base_url=os.getenv("AI_BASE_URL", AI_BASE_URL),
+    api_key=os.getenv("LANGDOCK_API_KEY") or "stub",  # ✅ Имя переменной такое же как в .env
+    timeout=AI_TIMEOUT,
+    max_retries=1,
+    http_client=httpx.AsyncClient(
+        timeout=AI_TIMEOUT,
+        limits=httpx.Limits(max_connections=AI_MAX_CONNECTIONS, max_keepalive_connections=AI_MAX_CONNECTIONS),
+    ),
 )
 
-# Основная функция получения AI-совета
-async def get_ai_description(card, card_info, zodiac_sign, is_reversed):
-    base_description = card_info.get('reversed_description') if is_reversed else card_info.get('description')
+# Не больше AI_MAX_CONCURRENCY запросов к модели одновременно
+_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+# Кэш готовых советов (ai_cache.AdviceCache); None — кэш выключен
+advice_cache = None
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные запросы с одинаковым ключом: первый вызов запускает
+    работу, остальные ждут тот же результат (или ту же ошибку).
+    Отмена одного ожидающего не трогает остальных; сама работа отменяется,
+    только когда её больше никто не ждёт.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key -> [task, число ожидающих]
+        self.calls = 0       # реально запущенных вызовов
+        self.coalesced = 0   # вызовов, присоединившихся к уже идущему
+
+    def _forget(self, key, task):
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
+
+    async def do(self, key, factory):
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda t: self._forget(key, t))
+            flight = self._flights[key] = [task, 0]
+            self.calls += 1
+        else:
+            task = flight[0]
+            self.coalesced += 1
+
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                self._forget(key, task)
+                task.cancel()
+
+    def __contains__(self, key):
+        return key in self._flights
+
+    @property
+    def in_flight(self):
+        return len(self._flights)
+
+    def summary(self):
+        total = self.calls + self.coalesced
+        saved = self.coalesced / total if total else 0.0
+        return f"запросов к модели {self.calls}, сэкономлено {self.coalesced} ({saved:.0%}), сейчас в работе {self.in_flight}"
+
+
+# Одинаковые промпты (карта, положение, знак), запрошенные одновременно, уходят к модели один раз
+inflight = SingleFlight()
+
+
+class AIUnavailable(Exception):
+    """
+    Модель сейчас не спрашиваем (размыкатель разомкнут) — сразу используется статичный совет.
+    """
+
+
+class CircuitBreaker:
+    """
+    Размыкатель: после failures подряд ошибок или превышений бюджета задержки
+    перестаёт обращаться к модели на cooldown секунд. Затем пропускает один пробный
+    запрос: удачный замыкает цепь, неудачный размыкает её снова.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'замкнут', 'разомкнут', 'пробный запрос'
+
+    def __init__(self, failures: int = 5, cooldown: float = 60.0):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info("Размыкатель AI замкнут: модель снова отвечает.")
+        self.state = self.CLOSED
+
+    def record_cancel(self):
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive >= self.failures):
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            logger.warning(f"Размыкатель AI разомкнут на {self.cooldown} с после {self.consecutive} неудач подряд.")
+
+
+breaker = CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN)
+
+# Задержки удачных запросов к модели — по ним считается порог для дублирующего запроса
+_latencies = deque(maxlen=200)
+
+# Каким путём получен каждый совет
+served = Counter()
+SERVED_LABELS = {
+    'cache': 'из кэша',
+    'upstream': 'от модели',
+    'hedge': 'дублирующим запросом',
+    'coalesced': 'общим запросом',
+    'stream': 'потоком',
+    'breaker_open': 'статично (размыкатель)',
+    'budget': 'статично (бюджет задержки)',
+    'error': 'статично (ошибка)',
+}
+
+
+def hedge_delay():
+    """
+    p95 задержки модели или None, если замеров пока мало (или дублирование выключено).
+    """
+    if not AI_HEDGE or len(_latencies) < AI_HEDGE_MIN_SAMPLES:
+        return None
+    return statistics.quantiles(_latencies, n=100, method='inclusive')[94]
+
 
-    messages = [
+def served_summary():
+    total = sum(served.values())
+    if not total:
+        return "советов ещё не было"
+    parts = [f"{label} {served[path]}" for path, label in SERVED_LABELS.items() if served[path]]
+    return ", ".join(parts) + f"; размыкатель {breaker.state}, срабатываний {breaker.trips}"
+
+
+def initialize_advice_cache(db, variants: int = 3, ttl: float = 30 * 24 * 3600):
+    global advice_cache
+    advice_cache = AdviceCache(db, variants=variants, ttl=ttl)
+
+
+def build_messages(card, card_info, zodiac_sign, is_reversed):
+    base_description = card_info.get('reversed_description') if is_reversed else card_info.get('description')
+    return [
         {
             "role": "system",
             "content": "Ты профессиональный таролог. Дай подробный и понятный совет по значению карты, в контексте повседневной жизни. Прогнозирование по знак зодиака и позициям планет. Можно в тоне Подружки и Стиля ТароМаро. Больше смайлов."
@@ -26,9 +203,226 @@ async def get_ai_description(card, card_info, zodiac_sign, is_reversed):
         }
     ]
 
-    response = client.chat.completions.create(
-        model="gpt-4o",  # ✅ Поддерживаемая модель от Langdock
-        messages=messages
-    )
 
+async def request_completion(messages):
+    """
+    Один запрос к модели с учётом общего лимита одновременных запросов.
+    Возвращает ответ целиком (с usage), текст — в response.choices[0].message.content.
+    """
+    async with _semaphore:
+        return await client.chat.completions.create(
+            model=AI_MODEL,  # ✅ Поддерживаемая модель от Langdock
+            messages=messages,
+            timeout=AI_TIMEOUT,
+        )
+
+
+async def _hedged_completion(messages):
+    """
+    Запрос к модели; если ответа нет дольше p95, параллельно уходит второй такой же,
+    и используется тот, что ответит первым. Возвращает (response, served_path).
+    """
+    first = asyncio.ensure_future(request_completion(messages))
+    delay = hedge_delay()
+    if delay is None:
+        return await first, 'upstream'
+
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks.add(asyncio.ensure_future(request_completion(messages)))
+        while True:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None or not tasks:
+                    return task.result(), ('upstream' if task is first else 'hedge')
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _call_upstream(messages):
+    """
+    Запрос к модели под защитой: размыкатель, бюджет задержки AI_LATENCY_BUDGET
+    и дублирующий запрос. Неудачи и превышения бюджета засчитываются размыкателю.
+    """
+    if not breaker.allow():
+        raise AIUnavailable("Размыкатель AI разомкнут")
+    started = time.monotonic()
+    try:
+        response, path = await asyncio.wait_for(_hedged_completion(messages), AI_LATENCY_BUDGET)
+    except asyncio.CancelledError:
+        # Отмена снаружи (запрос больше никому не нужен) — модель тут ни при чём
+        breaker.record_cancel()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    _latencies.append(time.monotonic() - started)
+    breaker.record_success()
+    served[path] += 1
+    return response
+
+
+async def generate_ai_description(card, card_info, zodiac_sign, is_reversed):
+    """
+    Запрос к модели в обход кэша.
+    """
+    response = await _call_upstream(build_messages(card, card_info, zodiac_sign, is_reversed))
     return response.choices[0].message.content.strip()
+
+
+def _count_failure(error):
+    if isinstance(error, AIUnavailable):
+        served['breaker_open'] += 1
+    elif isinstance(error, asyncio.TimeoutError):
+        served['budget'] += 1
+    else:
+        served['error'] += 1
+
+
+# Основная функция получения AI-совета.
+# Если модель недоступна, медленная или размыкатель разомкнут — исключение,
+# и вызывающий код подставляет статичный совет из cards_data.
+async def get_ai_description(card, card_info, zodiac_sign, is_reversed):
+    key = AdviceCache.key(card, is_reversed, zodiac_sign)
+    try:
+        return await _get_ai_description(key, card, card_info, zodiac_sign, is_reversed)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        _count_failure(e)
+        raise
+
+
+async def _get_ai_description(key, card, card_info, zodiac_sign, is_reversed):
+    if advice_cache is None:
+        return await _shared(key, lambda: generate_ai_description(card, card_info, zodiac_sign, is_reversed))
+
+    variant = advice_cache.pick_variant()
+    text = await advice_cache.get(key, variant)
+    if text is not None:
+        served['cache'] += 1
+        return text
+
+    async def fill():
+        result = await generate_ai_description(card, card_info, zodiac_sign, is_reversed)
+        try:
+            await advice_cache.put(key, variant, result)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить AI-совет в кэш: {e}")
+        return result
+
+    # Ключ без варианта: промпт один и тот же, так что ждущие одновременно
+    # получают текст, сохранённый в вариант первого запроса
+    return await _shared(key, fill)
+
+
+async def _shared(key, factory):
+    if key in inflight:
+        served['coalesced'] += 1
+    return await inflight.do(key, factory)
+
+
+async def _stream_completion(messages, chunks):
+    """
+    Потоковый запрос к модели: куски текста складываются в очередь chunks по мере прихода,
+    в конце (и при ошибке) в неё кладётся None. Возвращает весь текст.
+    Слот _semaphore занят, пока модель пишет ответ, но не пока читатель очереди
+    отправляет куски в Telegram. Бюджет AI_LATENCY_BUDGET действует до первого куска;
+    дублирующего запроса нет — поток уже начал отдавать текст.
+    """
+    if not breaker.allow():
+        chunks.put_nowait(None)
+        raise AIUnavailable("Размыкатель AI разомкнут")
+
+    parts = []
+    deadline = time.monotonic() + AI_LATENCY_BUDGET
+    try:
+        async with _semaphore:
+            stream = await asyncio.wait_for(client.chat.completions.create(
+                model=AI_MODEL,
+                messages=messages,
+                timeout=AI_TIMEOUT,
+                stream=True,
+            ), max(0.0, deadline - time.monotonic()))
+            async_chunks = stream.__aiter__()
+            while True:
+                try:
+                    if parts:
+                        chunk = await async_chunks.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(async_chunks.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    chunks.put_nowait(delta)
+    except asyncio.CancelledError:
+        breaker.record_cancel()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    finally:
+        chunks.put_nowait(None)
+    breaker.record_success()
+    served['stream'] += 1
+    return ''.join(parts).strip()
+
+
+async def stream_ai_description(card, card_info, zodiac_sign, is_reversed):
+    """
+    Асинхронный генератор кусков AI-совета по мере их прихода от модели.
+    Готовый текст из кэша отдаётся одним куском; сгенерированный целиком сохраняется в кэш.
+    Поток идёт через inflight: одновременные get_ai_description с тем же ключом ждут его текст,
+    а если такой совет уже генерируется, поток не открывается — готовый текст отдаётся одним куском.
+    """
+    key = AdviceCache.key(card, is_reversed, zodiac_sign)
+    variant = None
+    if advice_cache is not None:
+        variant = advice_cache.pick_variant()
+        text = await advice_cache.get(key, variant)
+        if text is not None:
+            served['cache'] += 1
+            yield text
+            return
+
+    if key in inflight:
+        yield await get_ai_description(card, card_info, zodiac_sign, is_reversed)
+        return
+
+    chunks = asyncio.Queue()
+
+    async def fill():
+        result = await _stream_completion(build_messages(card, card_info, zodiac_sign, is_reversed), chunks)
+        if advice_cache is not None:
+            try:
+                await advice_cache.put(key, variant, result)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить AI-совет в кэш: {e}")
+        return result
+
+    flight = asyncio.ensure_future(inflight.do(key, fill))
+    try:
+        while True:
+            delta = await chunks.get()
+            if delta is None:
+                break
+            yield delta
+        await flight
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        _count_failure(e)
+        raise
+    finally:
+        # Читатель ушёл раньше времени — генерация продолжится, только если её ждёт кто-то ещё
+        flight.cancel()
+
+
+async def close_ai_client():
+    await client.close()
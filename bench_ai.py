@@ -0,0 +1,65 @@
+"""
+Пропускная способность AI-советов на локальном стенде (без сети).
+
+Поднимает ai_stub_server в том же процессе, направляет на него ai_utils
+и запускает N одновременных get_ai_description. Заодно измеряет задержку
+цикла событий: с асинхронным клиентом она не должна расти вместе с задержкой модели.
+
+Запуск: python bench_ai.py --requests 200 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from ai_stub_server import StubAIServer
+import card_registry
+
+
+async def loop_lag(stop: asyncio.Event, interval=0.01):
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run(args):
+    server = StubAIServer(latency=args.latency, jitter=args.latency / 5)
+    await server.start()
+    os.environ['AI_BASE_URL'] = server.base_url
+    import ai_utils
+
+    latencies = []
+
+    async def one(i):
+        card = card_registry.CARDS[i % len(card_registry.CARDS)]
+        started = time.perf_counter()
+        await ai_utils.get_ai_description(card.name, card.info, 'Лев', i % 2 == 0)
+        latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await lag_task
+
+    await ai_utils.close_ai_client()
+    await server.close()
+
+    q = statistics.quantiles(latencies, n=100, method='inclusive')
+    print(f"Запросов: {args.requests} за {elapsed:.2f} с — {args.requests / elapsed:.1f} запр./с")
+    print(f"Задержка: p50 {q[49]:.3f} с, p95 {q[94]:.3f} с, max {max(latencies):.3f} с")
+    print(f"Одновременно у стенда: не больше {server.max_in_flight} (лимит AI_MAX_CONCURRENCY)")
+    print(f"Худшая задержка цикла событий: {worst_lag * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+Бенчмарк поиска карты по тексту: время построения индекса и задержка запроса.
+
+Запросы — точные названия, их начала, названия с опечаткой (пропущена или переставлена буква)
+и слова из значений карт. Для сравнения тот же поток прогоняется через наивный перебор
+(difflib по всем названиям), каким был бы поиск без индекса.
+
+Запуск: python bench_search.py --queries 5000
+"""
+import argparse
+import difflib
+import importlib
+import random
+import statistics
+import time
+
+import card_index
+import card_registry
+
+
+def percentiles(values):
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return f"p50 {q[49] * 1e6:.0f} мкс, p95 {q[94] * 1e6:.0f} мкс, p99 {q[98] * 1e6:.0f} мкс"
+
+
+def typo(word):
+    if len(word) < 4:
+        return word
+    i = random.randrange(1, len(word) - 1)
+    if random.random() < 0.5:
+        return word[:i] + word[i + 1:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def make_queries(count):
+    words = [w for w in card_index.POSTINGS if len(w) > 4]
+    makers = [
+        lambda card: card.name,
+        lambda card: card.name.lower()[:random.randint(3, len(card.name))],
+        lambda card: ' '.join(typo(w) for w in card.name.split()),
+        lambda card: random.choice(words),
+    ]
+    return [random.choice(makers)(random.choice(card_registry.CARDS)) for _ in range(count)]
+
+
+def naive_search(query, limit=5):
+    query = query.lower()
+    scored = [(difflib.SequenceMatcher(None, query, name.lower()).ratio(), name) for name in card_registry.NAMES]
+    return sorted(scored, reverse=True)[:limit]
+
+
+def measure(search, queries):
+    times = []
+    for query in queries:
+        t = time.perf_counter()
+        search(query)
+        times.append(time.perf_counter() - t)
+    return times
+
+
+def main(args):
+    random.seed(args.seed)
+    t = time.perf_counter()
+    importlib.reload(card_index)
+    build_time = time.perf_counter() - t
+    print(f"Индекс: {len(card_index.POSTINGS)} слов, {len(card_index.GRAMS)} триграмм, "
+          f"построен за {build_time * 1000:.1f} мс")
+
+    queries = make_queries(args.queries)
+    times = measure(card_index.search, queries)
+    print(f"Индекс:  {len(queries)} запросов, {percentiles(times)}")
+    naive = measure(naive_search, queries[:args.naive_queries])
+    print(f"Перебор: {len(naive)} запросов, {percentiles(naive)}")
+
+    # Насколько хорошо находятся названия с опечатками
+    found = 0
+    for card in card_registry.CARDS:
+        results = card_index.search(' '.join(typo(w) for w in card.name.split()), limit=3)
+        found += any(result.id == card.id for result, _ in results)
+    print(f"Название с опечаткой в первой тройке: {found}/{len(card_registry.CARDS)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--naive-queries', type=int, default=1000, help="запросов для наивного перебора")
+    parser.add_argument('--seed', type=int, default=1)
+    main(parser.parse_args())
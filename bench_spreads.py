@@ -0,0 +1,66 @@
+"""
+Бенчмарк раскладов: время отрисовки картинки и доля попаданий в дисковый кэш.
+
+Поток запросов берётся из пула заранее вытянутых раскладов (--distinct штук)
+с Zipf-подобным распределением: популярные расклады повторяются, редкие — нет.
+Кэш создаётся во временном каталоге и не трогает рабочий.
+
+Запуск: python bench_spreads.py --requests 500 --distinct 100 --max-files 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import card_images
+import spreads
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return "—"
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return f"p50 {q[49] * 1000:.1f} мс, p95 {q[94] * 1000:.1f} мс, max {max(values) * 1000:.1f} мс"
+
+
+async def run(args):
+    if spreads.Image is None:
+        raise SystemExit("Для бенчмарка нужен Pillow: pip install pillow")
+    card_images.initialize_card_images(os.path.dirname(os.path.abspath(__file__)), build_on_start=False)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = spreads.SpreadCache(directory, max_files=args.max_files)
+        pool = [(kind, spreads.draw_spread(kind)) for kind in args.kinds for _ in range(args.distinct)]
+        weights = [1 / (rank + 1) for rank in range(len(pool))]
+
+        render_times, hit_times = [], []
+        started = time.perf_counter()
+        for kind, draw in random.choices(pool, weights=weights, k=args.requests):
+            misses = cache.misses
+            t = time.perf_counter()
+            await cache.get_or_render(kind, draw)
+            (render_times if cache.misses > misses else hit_times).append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+
+        sizes = [entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.jpg')]
+
+    print(f"Запросов: {args.requests} за {elapsed:.2f} с, различных раскладов в пуле: {len(pool)}")
+    print(f"Кэш: {cache.summary()}")
+    print(f"Отрисовка (промах): {len(render_times)} шт., {percentiles(render_times)}")
+    print(f"Из кэша (попадание): {len(hit_times)} шт., {percentiles(hit_times)}")
+    if sizes:
+        print(f"Размер картинки расклада: в среднем {statistics.mean(sizes) / 1024:.0f} КБ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--distinct', type=int, default=100, help="различных раскладов каждого вида")
+    parser.add_argument('--max-files', type=int, default=50, help="ёмкость кэша")
+    parser.add_argument('--kinds', nargs='+', default=list(spreads.SPREADS), choices=list(spreads.SPREADS))
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
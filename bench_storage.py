@@ -0,0 +1,80 @@
+"""
+Бенчмарк записи карты дня: сколько вытягиваний в секунду выдерживает база.
+
+'legacy' — журнал отката и два commit на вытягивание (как было в daily_card).
+'wal'    — WAL, настроенные PRAGMA и групповая фиксация через одного писателя.
+
+Запуск: python bench_storage.py --users 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from db import Database
+from migrations import run_migrations
+
+UPDATE_USER = (
+    "UPDATE users SET total_cards = total_cards + 1, straight_cards = straight_cards + ?, "
+    "reversed_cards = reversed_cards + ?, consecutive_days = 1, last_card_date = ? WHERE user_id = ?"
+)
+INSERT_HISTORY = "INSERT INTO history (user_id, date, card, is_reversed, type) VALUES (?, ?, ?, ?, 'daily_card')"
+
+
+def prepare(conn, users):
+    run_migrations(conn)
+    conn.executemany(
+        "INSERT INTO users (user_id, nickname, zodiac_sign) VALUES (?, ?, ?)",
+        [(uid, f"user{uid}", 'Лев') for uid in range(users)]
+    )
+    conn.commit()
+
+
+async def draw(db, user_id, separate_commits):
+    await db.fetchone("SELECT nickname, zodiac_sign, total_cards FROM users WHERE user_id = ?", (user_id,))
+    is_reversed = random.random() < 0.5
+    now = int(time.time())
+    update = (UPDATE_USER, (int(not is_reversed), int(is_reversed), time.strftime('%Y-%m-%d'), user_id))
+    insert = (INSERT_HISTORY, (user_id, now, 'Шут', int(is_reversed)))
+    if separate_commits:
+        await db.execute(*update)
+        await db.execute(*insert)
+    else:
+        await db.transaction([update, insert])
+
+
+async def run(mode, users, concurrency, group_commit_ms):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), mode=mode, group_commit_ms=group_commit_ms)
+        db.run_sync(prepare, users)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(user_id):
+            async with semaphore:
+                await draw(db, user_id, separate_commits=(mode == 'legacy'))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(uid) for uid in range(users)))
+        await db.stop_writer()
+        elapsed = time.perf_counter() - started
+        db.close()
+    return users / elapsed, elapsed, db.batches_committed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--group-commit-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    for mode in ('legacy', 'wal'):
+        rate, elapsed, batches = asyncio.run(run(mode, args.users, args.concurrency, args.group_commit_ms))
+        extra = f", транзакций: {batches}" if mode == 'wal' else ""
+        print(f"{mode:>6}: {rate:8.1f} вытягиваний/с ({args.users} за {elapsed:.2f} с{extra})")
+
+
+if __name__ == '__main__':
+    main()
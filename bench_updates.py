@@ -0,0 +1,129 @@
+"""
+Нагрузочный тест обработки апдейтов: по очереди (как раньше), параллельно без замков
+(SimpleUpdateProcessor — для сравнения) и параллельно с порядком на пользователя
+(PerUserUpdateProcessor).
+
+Апдейты приходят пуассоновским потоком от --users пользователей. Доля --slow-share из них —
+«карта дня»: первая за день у пользователя ждёт AI-совет (--slow секунд), остальные
+и все прочие апдейты — нажатия меню (--fast секунд).
+Очередь апдейтов разбирается так же, как в Application: при лимите 1 — ожиданием,
+иначе — задачей на каждый апдейт. Задержка считается от прихода апдейта до конца обработки.
+Заодно проверяется, что апдейты одного пользователя обработаны по порядку и что
+«карта дня» не вытянута дважды за день (проверка daily_card_date в user_data).
+
+Запуск: python bench_updates.py --updates 600 --rate 30
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from telegram.ext import SimpleUpdateProcessor
+
+from update_processing import PerUserUpdateProcessor
+
+
+def percentiles(values):
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return f"p50 {q[49] * 1000:.0f} мс, p95 {q[94] * 1000:.0f} мс, p99 {q[98] * 1000:.0f} мс, max {max(values) * 1000:.0f} мс"
+
+
+def make_workload(args):
+    random.seed(args.seed)
+    arrivals, at = [], 0.0
+    for seq in range(args.updates):
+        at += random.expovariate(args.rate)
+        slow = random.random() < args.slow_share
+        arrivals.append((at, random.randrange(args.users), seq, slow))
+    return arrivals
+
+
+async def run(processor, arrivals, args):
+    user_data = defaultdict(dict)
+    handled = defaultdict(list)
+    latencies, slow_latencies = [], []
+    draws = defaultdict(int)
+    queue = asyncio.Queue()
+
+    async def handle(arrived, user_id, seq, slow):
+        if slow and user_data[user_id].get('daily_card_date') != 'today':
+            # Как daily_card: проверили дату, долго ждали AI-совет, записали дату
+            await asyncio.sleep(args.slow)
+            draws[user_id] += 1
+            user_data[user_id]['daily_card_date'] = 'today'
+        else:
+            await asyncio.sleep(args.fast)
+        # Порядок проверяем по завершению: ответы пользователю должны уходить в порядке его апдейтов
+        handled[user_id].append(seq)
+        (slow_latencies if slow else latencies).append(time.perf_counter() - arrived)
+
+    async def process(item):
+        try:
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=item[1]), effective_chat=None)
+            await processor.process_update(update, handle(*item))
+        finally:
+            queue.task_done()
+
+    async def fetcher():
+        # Как Application.__update_fetcher
+        tasks = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return tasks
+            if processor.max_concurrent_updates > 1:
+                tasks.append(asyncio.create_task(process(item)))
+            else:
+                await process(item)
+
+    async with processor:
+        consumer = asyncio.create_task(fetcher())
+        started = time.perf_counter()
+        for at, user_id, seq, slow in arrivals:
+            delay = started + at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queue.put_nowait((time.perf_counter(), user_id, seq, slow))
+        queue.put_nowait(None)
+        await queue.join()
+        await asyncio.gather(*await consumer)
+        elapsed = time.perf_counter() - started
+
+    out_of_order = sum(seqs != sorted(seqs) for seqs in handled.values())
+    double_draws = sum(count - 1 for count in draws.values())
+    return latencies, slow_latencies, elapsed, out_of_order, double_draws
+
+
+async def main(args):
+    arrivals = make_workload(args)
+    print(f"Апдейтов: {len(arrivals)} от {args.users} пользователей, {args.rate}/с, "
+          f"медленных {args.slow_share:.0%} по {args.slow * 1000:.0f} мс, быстрых по {args.fast * 1000:.0f} мс")
+    modes = [
+        ("По очереди", SimpleUpdateProcessor(1)),
+        (f"Параллельно ({args.concurrency}) без замков", SimpleUpdateProcessor(args.concurrency)),
+        (f"Параллельно ({args.concurrency}) с порядком на пользователя", PerUserUpdateProcessor(args.concurrency, args.queue)),
+    ]
+    for title, processor in modes:
+        fast, slow, elapsed, out_of_order, double_draws = await run(processor, arrivals, args)
+        print(f"\n{title}: {elapsed:.1f} с")
+        print(f"  меню:            {percentiles(fast)}")
+        print(f"  карта дня с AI:  {percentiles(slow)}")
+        print(f"  нарушений порядка у пользователей: {out_of_order}, повторных карт дня: {double_draws}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=600)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=30, help="апдейтов в секунду")
+    parser.add_argument('--slow-share', type=float, default=0.05)
+    parser.add_argument('--slow', type=float, default=0.5, help="время AI-совета, с")
+    parser.add_argument('--fast', type=float, default=0.005, help="время быстрого апдейта, с")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--queue', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
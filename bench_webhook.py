@@ -0,0 +1,171 @@
+"""
+Стенд webhook без сети: синтетические апдейты отправляются POST-запросами в WebhookServer,
+а Bot API подменяется локальным (OfflineRequest), так что весь путь
+HTTP -> очередь -> Update -> Application -> обработчик -> sendMessage проходит на этой машине.
+
+Генератор держит --connections keep-alive соединений (как Telegram, до max_connections)
+и отправляет --updates апдейтов от --users пользователей. Обработчик отвечает через
+reply_text после --handler-delay секунд. Считаются пропускная способность и задержка от POST
+до вызова sendMessage, плюс проверяется, что запросы с неверным секретом отклоняются.
+
+Запуск: python bench_webhook.py --updates 5000 --connections 40
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+from telegram.request import BaseRequest
+
+from update_processing import PerUserUpdateProcessor
+from webhook import SECRET_HEADER, WebhookServer
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Taro', 'username': 'taro_bench_bot'}
+
+
+class OfflineRequest(BaseRequest):
+    """
+    Bot API на месте: getMe возвращает бота, sendMessage — отправленное сообщение.
+    """
+
+    def __init__(self, on_send=None):
+        self.on_send = on_send
+        self.calls = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method == 'sendMessage':
+            result = {
+                'message_id': self.calls, 'date': int(time.time()), 'text': params.get('text', ''),
+                'chat': {'id': params['chat_id'], 'type': 'private'}, 'from': BOT_USER,
+            }
+            if self.on_send is not None:
+                self.on_send(params)
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def make_update(update_id, user_id):
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': f"#{update_id}",
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+        },
+    }
+
+
+async def post(reader, writer, path, body, secret):
+    writer.write((
+        f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n{SECRET_HEADER}: {secret}\r\n\r\n"
+    ).encode('latin-1') + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    length = next(int(line.split(':', 1)[1]) for line in lines if line.lower().startswith('content-length:'))
+    await reader.readexactly(length)
+    return int(lines[0].split(' ')[1])
+
+
+def percentiles(values):
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return f"p50 {q[49] * 1000:.1f} мс, p95 {q[94] * 1000:.1f} мс, p99 {q[98] * 1000:.1f} мс"
+
+
+async def run(args):
+    posted_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    def on_send(params):
+        update_id = int(params['text'].lstrip('#'))
+        latencies.append(time.perf_counter() - posted_at[update_id])
+        if len(latencies) == args.updates:
+            done.set()
+
+    async def echo(update, context):
+        await asyncio.sleep(args.handler_delay)
+        await update.message.reply_text(update.message.text)
+
+    builder = ApplicationBuilder().token('1:bench').request(OfflineRequest(on_send)).updater(None)
+    if args.concurrency > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(args.concurrency, args.concurrency * 8))
+    app = builder.build()
+    app.add_handler(MessageHandler(filters.TEXT, echo))
+    server = WebhookServer(app, '/telegram', 'bench-secret', workers=args.workers,
+                           queue_size=args.queue, max_connections=args.connections)
+
+    async with app:
+        await app.start()
+        port = await server.start('127.0.0.1', 0)
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        wrong = await post(reader, writer, '/telegram', b'{}', 'wrong-secret')
+        writer.close()
+
+        updates = [(update_id, make_update(update_id, update_id % args.users + 1)) for update_id in range(args.updates)]
+        statuses = []
+
+        async def connection(chunk):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            try:
+                for update_id, update in chunk:
+                    body = json.dumps(update).encode()
+                    while True:
+                        posted_at[update_id] = time.perf_counter()
+                        status = await post(reader, writer, '/telegram', body, 'bench-secret')
+                        statuses.append(status)
+                        if status != 503:
+                            break
+                        await asyncio.sleep(0.05)  # как Telegram: повторить позже
+            finally:
+                writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connection(updates[i::args.connections]) for i in range(args.connections)))
+        accepted = time.perf_counter() - started
+        await asyncio.wait_for(done.wait(), timeout=60)
+        elapsed = time.perf_counter() - started
+
+        await server.stop()
+        await app.stop()
+
+    print(f"Апдейтов: {args.updates} от {args.users} пользователей, соединений {args.connections}, "
+          f"разборщиков {args.workers}, параллельных апдейтов {args.concurrency}")
+    print(f"Неверный секрет: HTTP {wrong}")
+    print(f"Приём: {accepted:.2f} с ({args.updates / accepted:.0f} запросов/с), ответов 503: {statuses.count(503)}")
+    print(f"До ответа пользователю: {elapsed:.2f} с ({args.updates / elapsed:.0f} апдейтов/с)")
+    print(f"Задержка POST -> sendMessage: {percentiles(latencies)}")
+    print(f"Сервер: {server.summary()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--connections', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32, help="параллельных апдейтов (1 — по очереди)")
+    parser.add_argument('--handler-delay', type=float, default=0.0, help="время работы обработчика, с")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import Forbidden, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Последний отчёт каждой рассылки по имени — для админ-панели
+last_reports = {}
+
+
+class TokenBucket:
+    """
+    Корзина токенов: не больше rate операций в секунду с запасом capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastReport:
+    def __init__(self, name):
+        self.name = name
+        self.total = None
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.blocked
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        total = self.total if self.total is not None else '?'
+        return (
+            f"{self.name}: {self.processed}/{total} обработано, отправлено {self.sent}, "
+            f"ошибок {self.failed}, заблокировали бота {self.blocked}, повторов после 429: {self.retries}, "
+            f"пропущено {self.skipped}, {self.elapsed:.1f} с, {self.rate:.1f} польз./с"
+        )
+
+
+class _LimitedBot:
+    """
+    Обёртка над Bot: каждый вызов send_*/edit_* проходит через лимиты рассылки.
+    """
+
+    def __init__(self, bot, broadcaster):
+        self._bot = bot
+        self._broadcaster = broadcaster
+
+    def __getattr__(self, name):
+        method = getattr(self._bot, name)
+        if not name.startswith(('send_', 'edit_', 'copy_', 'forward_')):
+            return method
+
+        async def limited(*args, chat_id, **kwargs):
+            return await self._broadcaster.send(method, *args, chat_id=chat_id, **kwargs)
+        return limited
+
+
+class Broadcaster:
+    """
+    Рассылка с ограниченной параллельностью.
+    Соблюдает общий лимит Telegram (global_rate сообщений/с) и лимит на чат (per_chat_rate),
+    при RetryAfter ставит всю рассылку на паузу и повторяет отправку.
+    """
+
+    def __init__(self, bot, concurrency: int = 20, global_rate: float = 25.0,
+                 per_chat_rate: float = 1.0, max_retries: int = 3, progress_every: float = 10.0):
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.progress_every = progress_every
+        self.global_bucket = TokenBucket(global_rate)
+        self.bot = _LimitedBot(bot, self)
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+        self.report = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        return bucket
+
+    async def _wait_pause(self):
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+    async def send(self, method, *args, chat_id, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self._wait_pause()
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await method(*args, chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                if self.report is not None:
+                    self.report.retries += 1
+                logger.warning(f"Telegram просит подождать {retry_after} с (чат {chat_id}).")
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                # Файл уже прочитан первой попыткой — отправим его заново с начала
+                for value in kwargs.values():
+                    if hasattr(value, 'seek'):
+                        value.seek(0)
+
+    async def _progress(self, report):
+        while True:
+            await asyncio.sleep(self.progress_every)
+            logger.info(report.summary())
+
+    async def run(self, user_ids, deliver, total=None, name="Рассылка", skipped=0):
+        """
+        Вызывает await deliver(self.bot, user_id) для каждого user_id
+        (обычного или асинхронного итератора) не более чем в concurrency задачах.
+        skipped — сколько получателей отброшено заранее (например, с истёкшей подпиской);
+        к ним добавляются те, для кого deliver вернул False.
+        """
+        report = self.report = last_reports[name] = BroadcastReport(name)
+        report.total = total
+        report.skipped = skipped
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def produce():
+            try:
+                if hasattr(user_ids, '__aiter__'):
+                    async for user_id in user_ids:
+                        await queue.put(user_id)
+                else:
+                    for user_id in user_ids:
+                        await queue.put(user_id)
+            except Exception as e:
+                logger.error(f"{name}: ошибка при чтении получателей: {e}")
+            # Сигнал завершения для каждого рабочего
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                user_id = await queue.get()
+                if user_id is None:
+                    return
+                try:
+                    if await deliver(self.bot, user_id) is False:
+                        report.skipped += 1
+                    else:
+                        report.sent += 1
+                except Forbidden:
+                    report.blocked += 1
+                except Exception as e:
+                    report.failed += 1
+                    logger.error(f"{name}: не удалось доставить пользователю {user_id}: {e}")
+                finally:
+                    self._chat_buckets.pop(user_id, None)
+
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        progress = asyncio.create_task(self._progress(report))
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in (producer, progress, *workers):
+                task.cancel()
+            report.finished = time.monotonic()
+        logger.info(report.summary())
+        return report
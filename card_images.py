@@ -0,0 +1,158 @@
+"""
+Подготовка картинок карт для отправки в Telegram.
+
+Для каждой картинки из images/ в кэш-каталоге строятся:
+  <имя>.jpg          — уменьшенная до IMAGE_MAX_SIDE и пережатая копия;
+  <имя>.reversed.jpg — та же картинка, повёрнутая на 180° (для перевёрнутых карт).
+Хэш исходника хранится в manifest.json: неизменённые картинки не пересобираются.
+Pillow — необязательная зависимость: без него бот отправляет исходные картинки.
+
+Запуск: python card_images.py [--force]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не установлен — работаем с исходными картинками
+    Image = None
+
+import card_registry
+from config import IMAGE_CACHE_DIR, IMAGE_MAX_SIDE, IMAGE_QUALITY
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+# Меняется при изменении параметров сборки — тогда всё собирается заново
+BUILD_VERSION = f"1:{IMAGE_MAX_SIDE}:{IMAGE_QUALITY}"
+
+# Каталог бота; до initialize_card_images — каталог этого модуля (там же лежит images/)
+BASE_DIR = None
+_manifest = {}  # image_file -> {'hash', 'upright', 'reversed'}
+
+
+def _base_dir():
+    return BASE_DIR or os.path.dirname(os.path.abspath(__file__))
+
+
+def _images_dir():
+    return os.path.join(_base_dir(), 'images')
+
+
+def _cache_dir():
+    return os.path.join(_base_dir(), IMAGE_CACHE_DIR)
+
+
+def _source_hash(path):
+    digest = hashlib.sha256(BUILD_VERSION.encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save(image, path):
+    # Пишем во временный файл и переименовываем, чтобы бот не отправил недописанную картинку
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=False)
+    os.replace(tmp_path, path)
+
+
+def _build_one(source_path, stem):
+    with Image.open(source_path) as source:
+        image = source.convert('RGB')
+    image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+    upright = f"{stem}.jpg"
+    reversed_ = f"{stem}.reversed.jpg"
+    _save(image, os.path.join(_cache_dir(), upright))
+    _save(image.rotate(180), os.path.join(_cache_dir(), reversed_))
+    return upright, reversed_
+
+
+def _load_manifest():
+    path = os.path.join(_cache_dir(), MANIFEST)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build(force=False):
+    """
+    Собирает недостающие и устаревшие картинки. Возвращает (собрано, пропущено, нет исходника).
+    """
+    global _manifest
+    if Image is None:
+        raise RuntimeError("Для сборки картинок нужен Pillow: pip install pillow")
+    os.makedirs(_cache_dir(), exist_ok=True)
+    manifest = {} if force else _load_manifest()
+    built = skipped = missing = 0
+    for image_file in sorted({card.image_file for card in card_registry.CARDS}):
+        source_path = os.path.join(_images_dir(), image_file)
+        if not os.path.exists(source_path):
+            missing += 1
+            continue
+        source_hash = _source_hash(source_path)
+        entry = manifest.get(image_file)
+        if (entry and entry['hash'] == source_hash
+                and all(os.path.exists(os.path.join(_cache_dir(), entry[k])) for k in ('upright', 'reversed'))):
+            skipped += 1
+            continue
+        upright, reversed_ = _build_one(source_path, os.path.splitext(image_file)[0])
+        manifest[image_file] = {'hash': source_hash, 'upright': upright, 'reversed': reversed_}
+        built += 1
+
+    with open(os.path.join(_cache_dir(), MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    _manifest = manifest
+    return built, skipped, missing
+
+
+def initialize_card_images(base_directory, build_on_start=True):
+    """
+    Запоминает каталог бота и, если есть Pillow, дособирает изменившиеся картинки.
+    """
+    global BASE_DIR, _manifest
+    BASE_DIR = base_directory
+    _manifest = _load_manifest()
+    if not build_on_start:
+        return
+    if Image is None:
+        logger.info("Pillow не установлен — отправляются исходные картинки карт.")
+        return
+    try:
+        built, skipped, missing = build()
+        logger.info(f"Картинки карт: собрано {built}, без изменений {skipped}, нет исходника {missing}.")
+    except Exception as e:
+        logger.error(f"Не удалось подготовить картинки карт: {e}")
+
+
+def image_path(image_file, is_reversed=False):
+    """
+    Путь к картинке для отправки: подготовленная копия (повёрнутая для перевёрнутой карты),
+    если она собрана, иначе исходник из images/. До initialize_card_images — всегда исходник.
+    """
+    entry = _manifest.get(image_file)
+    if entry:
+        path = os.path.join(_cache_dir(), entry['reversed' if is_reversed else 'upright'])
+        if os.path.exists(path):
+            return path
+    return os.path.join(_images_dir(), image_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', action='store_true', help="пересобрать все картинки")
+    args = parser.parse_args()
+    initialize_card_images(os.path.dirname(os.path.abspath(__file__)), build_on_start=False)
+    built, skipped, missing = build(force=args.force)
+    sizes = [(os.path.getsize(os.path.join(_images_dir(), f)), os.path.getsize(os.path.join(_cache_dir(), e['upright'])))
+             for f, e in _manifest.items()]
+    before, after = sum(s for s, _ in sizes), sum(s for _, s in sizes)
+    print(f"Собрано: {built}, без изменений: {skipped}, нет исходника: {missing}")
+    if before:
+        print(f"Размер отправки: {before / 1024:.0f} КБ -> {after / 1024:.0f} КБ ({after / before:.0%})")
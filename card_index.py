@@ -0,0 +1,174 @@
+"""
+Поиск карты по свободному тексту: часть названия, название с опечаткой
+или слово из значения/совета.
+
+Индекс строится один раз при импорте по card_registry:
+  слово -> {id карты: вес поля} (название весит больше значения и совета);
+  триграмма -> слова словаря, в которых она встречается.
+Слово запроса сопоставляется со словами словаря по доле общих триграмм (коэффициент Дайса),
+так что опечатки и неполные слова тоже находят карту. Регистр и ё/е не различаются.
+"""
+import re
+from collections import defaultdict
+
+import card_registry
+
+NAME_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+# Весь запрос есть в названии: каждое слово запроса — целое слово названия или его начало
+# не короче MIN_PHRASE_PREFIX букв («короле пент» -> «Королева Пентаклей», но «да» — не «Звезда»)
+PHRASE_BONUS = 2.0
+MIN_PHRASE_PREFIX = 4
+# Ниже этой похожести слово запроса со словом словаря не сопоставляется
+MIN_SIMILARITY = 0.45
+MIN_PREFIX = 3
+# Опечатки в коротких словах («Бшаня», «Сметрь») рвут почти все триграммы —
+# если по триграммам лучшая похожесть ниже EDIT_BELOW (например, «сметрь» сходится только
+# со «смело»), кандидаты проверяются ещё и редакционным расстоянием:
+# одна правка для слов до 6 букв, две — для более длинных
+MIN_EDIT_WORD = 4
+EDIT_BELOW = 0.6
+# Результаты намного слабее лучшего не показываем («смерть» -> только «Смерть»)
+MIN_RELATIVE_SCORE = 0.5
+
+# Служебные слова встречаются почти в каждом описании и только зашумляют выдачу
+STOP_WORDS = frozenset(
+    'а в вам вас ваш ваши вы для до же за и из или к как на не но о об от по с со так то у что это'.split()
+)
+
+_WORD = re.compile(r'[0-9a-zа-я]+')
+
+
+def normalize(text):
+    return ' '.join(_WORD.findall(text.lower().replace('ё', 'е')))
+
+
+def words_of(text):
+    return [word for word in normalize(text).split() if word not in STOP_WORDS]
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """
+    Расстояние Дамерау — Левенштейна (вставка, удаление, замена, перестановка соседних букв).
+    """
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[-1]
+
+
+def _build():
+    postings = defaultdict(dict)  # слово -> {card_id: вес}
+    for card in card_registry.CARDS:
+        fields = ((card.name, NAME_WEIGHT),
+                  (' '.join((card.description, card.reversed_description, card.advice)), TEXT_WEIGHT))
+        for text, weight in fields:
+            for word in words_of(text):
+                if postings[word].get(card.id, 0) < weight:
+                    postings[word][card.id] = weight
+    grams = defaultdict(set)
+    word_grams = {}
+    for word in postings:
+        word_grams[word] = trigrams(word)
+        for gram in word_grams[word]:
+            grams[gram].add(word)
+    names = {card.id: tuple(normalize(card.name).split()) for card in card_registry.CARDS}
+    name_words = defaultdict(set)  # слово названия -> id карт
+    for card_id, words in names.items():
+        for word in words:
+            name_words[word].add(card_id)
+    return dict(postings), dict(grams), word_grams, names, dict(name_words)
+
+
+POSTINGS, GRAMS, WORD_GRAMS, NAMES, NAME_WORDS = _build()
+
+
+def similar_words(word):
+    """
+    Слова словаря, похожие на word: {слово: похожесть от 0 до 1}.
+    """
+    query_grams = trigrams(word)
+    shared = defaultdict(int)
+    for gram in query_grams:
+        for candidate in GRAMS.get(gram, ()):
+            shared[candidate] += 1
+    result = {}
+    for candidate, count in shared.items():
+        similarity = 2 * count / (len(query_grams) + len(WORD_GRAMS[candidate]))
+        # Начало слова («пентак», «корол») считаем почти полным совпадением
+        if len(word) >= MIN_PREFIX and candidate.startswith(word):
+            similarity = max(similarity, 0.9)
+        if similarity >= MIN_SIMILARITY:
+            result[candidate] = similarity
+    if len(word) < MIN_EDIT_WORD or max(result.values(), default=0.0) >= EDIT_BELOW:
+        return result
+
+    max_edits = 1 if len(word) < 6 else 2
+    # Одна правка меняет не больше четырёх триграмм (перестановка) — у более далёких слов общих меньше
+    min_shared = len(query_grams) - 4 * max_edits
+    for candidate, count in shared.items():
+        if count >= min_shared and abs(len(candidate) - len(word)) <= max_edits:
+            edits = edit_distance(word, candidate)
+            if edits <= max_edits:
+                similarity = 1 - edits / max(len(word), len(candidate))
+                result[candidate] = max(result.get(candidate, 0.0), similarity)
+    return result
+
+
+def _phrase_cards(query_words):
+    """
+    id карт, в названии которых есть каждое слово запроса (целиком или началом от MIN_PHRASE_PREFIX букв).
+    """
+    result = None
+    for word in query_words:
+        cards = set(NAME_WORDS.get(word, ()))
+        if len(word) >= MIN_PHRASE_PREFIX:
+            for name_word, card_ids in NAME_WORDS.items():
+                if name_word.startswith(word):
+                    cards |= card_ids
+        result = cards if result is None else result & cards
+        if not result:
+            return set()
+    return result
+
+
+def search(query, limit=5, whole_name=False):
+    """
+    Карты по запросу, лучшие первыми: [(Card, оценка), ...].
+    С whole_name=True — только карты, у которых в запросе нашлось (хотя бы с опечаткой)
+    каждое слово названия: так отвечаем на свободный текст, а не на случайное слово из фразы.
+    """
+    query_words = normalize(query).split()
+    words = words_of(query)
+    if not words:
+        return []
+    scores = defaultdict(float)
+    matched = set()
+    for word in words:
+        best = {}
+        for candidate, similarity in similar_words(word).items():
+            matched.add(candidate)
+            for card_id, weight in POSTINGS[candidate].items():
+                best[card_id] = max(best.get(card_id, 0.0), similarity * weight)
+        for card_id, score in best.items():
+            scores[card_id] += score
+    for card_id in _phrase_cards(query_words):
+        scores[card_id] += PHRASE_BONUS
+    if whole_name:
+        scores = {card_id: score for card_id, score in scores.items() if matched.issuperset(NAMES[card_id])}
+    if not scores:
+        return []
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    threshold = ranked[0][1] * MIN_RELATIVE_SCORE
+    return [(card_registry.CARDS[card_id], score / len(words))
+            for card_id, score in ranked[:limit] if score >= threshold]
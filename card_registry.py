@@ -0,0 +1,92 @@
+"""
+Реестр карт, один раз собранный из cards_data.cards при импорте.
+
+У каждой карты постоянный целый id — её порядковый номер в cards_data
+(новые карты добавляйте в конец, чтобы id старых не сдвинулись).
+Масть берётся из поля suit, а если его нет — из последнего слова названия.
+"""
+import logging
+import os
+import random
+
+from cards_data import cards
+
+logger = logging.getLogger(__name__)
+
+SUITS = ('Major', 'Pentacles', 'Wands', 'Cups', 'Swords')
+SUIT_BY_SUFFIX = {
+    'Пентаклей': 'Pentacles',
+    'Жезлов': 'Wands',
+    'Кубков': 'Cups',
+    'Мечей': 'Swords',
+}
+
+
+class Card:
+    __slots__ = ('id', 'name', 'suit', 'description', 'reversed_description', 'advice', 'image_file', 'info')
+
+    def __init__(self, card_id, name, suit, info):
+        self.id = card_id
+        self.name = name
+        self.suit = suit
+        self.description = info.get('description', '')
+        self.reversed_description = info.get('reversed_description', '')
+        self.advice = info.get('advice', '')
+        self.image_file = info.get('image_file', '')
+        # Исходный словарь из cards_data — для кода, который ждёт card_info
+        self.info = info
+
+    def meaning(self, is_reversed):
+        return self.reversed_description if is_reversed else self.description
+
+    def __repr__(self):
+        return f"Card({self.id}, {self.name!r}, {self.suit})"
+
+
+def _suit_of(name, info):
+    suit = info.get('suit') or SUIT_BY_SUFFIX.get(name.rsplit(' ', 1)[-1])
+    if suit not in SUITS:
+        raise ValueError(f"Не удалось определить масть карты «{name}»")
+    return suit
+
+
+def _compile():
+    compiled = tuple(Card(card_id, name, _suit_of(name, info), info) for card_id, (name, info) in enumerate(cards.items()))
+    by_suit = {suit: tuple(card for card in compiled if card.suit == suit) for suit in SUITS}
+    return compiled, {card.name: card for card in compiled}, by_suit
+
+
+CARDS, BY_NAME, BY_SUIT = _compile()
+NAMES = tuple(card.name for card in CARDS)
+
+
+def get(name):
+    return BY_NAME.get(name)
+
+
+def by_id(card_id):
+    if 0 <= card_id < len(CARDS):
+        return CARDS[card_id]
+    return None
+
+
+def random_card():
+    return random.choice(CARDS)
+
+
+def missing_images(images_dir):
+    return [card for card in CARDS if not os.path.exists(os.path.join(images_dir, card.image_file))]
+
+
+def validate_images(images_dir=None):
+    """
+    Предупреждает о картах, у которых нет файла картинки, и возвращает их список.
+    Это не ошибка: такие карты отправляются без фото. Вызывается при запуске бота (main).
+    """
+    images_dir = images_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+    missing = missing_images(images_dir)
+    if missing:
+        logger.warning(
+            "Нет картинок для карт: " + ", ".join(f"{card.name} ({card.image_file})" for card in missing)
+        )
+    return missing
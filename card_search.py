@@ -1,93 +1,111 @@
-import os
 import logging
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup
 )
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-# Предполагаем, что в cards_data.py у вас есть словарь "cards":
-# cards = {
-#   "Туз Пентаклей": {
-#       "description": "...",
-#       "advice": "...",
-#       "image_file": "tuz_pentakley.jpg"
-#   },
-#   ...
-# }
-from cards_data import cards
+# Карты берутся из реестра (card_registry), собранного из cards_data.cards:
+# масти, порядок и постоянные id карт
+import card_registry
+import card_index
+import telegram_files
+import card_images
 
 logger = logging.getLogger(__name__)
 
-# Список мастей и входящих в них карт
-SUITS = {
-    "Major": [
-        "Шут", "Маг", "Жрица", "Императрица", "Император", "Верховный жрец",
-        "Влюблённые", "Колесница", "Справедливость", "Отшельник",
-        "Колесо Фортуны", "Сила", "Повешенный", "Смерть", "Умеренность",
-        "Дьявол", "Башня", "Звезда", "Луна", "Солнце", "Суд", "Мир"
-    ],
-    "Pentacles": [
-        "Туз Пентаклей", "Двойка Пентаклей", "Тройка Пентаклей", "Четвёрка Пентаклей",
-        "Пятёрка Пентаклей", "Шестёрка Пентаклей", "Семёрка Пентаклей",
-        "Восьмёрка Пентаклей", "Девятка Пентаклей", "Десятка Пентаклей",
-        "Паж Пентаклей", "Рыцарь Пентаклей", "Королева Пентаклей", "Король Пентаклей"
-    ],
-    "Wands": [
-        "Туз Жезлов", "Двойка Жезлов", "Тройка Жезлов", "Четвёрка Жезлов",
-        "Пятёрка Жезлов", "Шестёрка Жезлов", "Семёрка Жезлов",
-        "Восьмёрка Жезлов", "Девятка Жезлов", "Десятка Жезлов",
-        "Паж Жезлов", "Рыцарь Жезлов", "Королева Жезлов", "Король Жезлов"
-    ],
-    "Cups": [
-        "Туз Кубков", "Двойка Кубков", "Тройка Кубков", "Четвёрка Кубков",
-        "Пятёрка Кубков", "Шестёрка Кубков", "Семёрка Кубков",
-        "Восьмёрка Кубков", "Девятка Кубков", "Десятка Кубков",
-        "Паж Кубков", "Рыцарь Кубков", "Королева Кубков", "Король Кубков"
-    ],
-    "Swords": [
-        "Туз Мечей", "Двойка Мечей", "Тройка Мечей", "Четвёрка Мечей",
-        "Пятёрка Мечей", "Шестёрка Мечей", "Семёрка Мечей",
-        "Восьмёрка Мечей", "Девятка Мечей", "Десятка Мечей",
-        "Паж Мечей", "Рыцарь Мечей", "Королева Мечей", "Король Мечей"
-    ]
-}
 
+# Формат callback_data: «s<версия>:<номер масти>», «s<версия>:b» (назад к мастям)
+# и «c<версия>:<id карты в base36>». Версию нужно поднять, если id карт в реестре поменяются:
+# тогда кнопки старых сообщений распознаются как устаревшие, а не ведут на чужую карту.
+CALLBACK_VERSION = 1
+SUIT_PATTERN = r'^(s\d+:|suit_)'
+CARD_PATTERN = r'^(c\d+:|card_)'
 
-def suits_keyboard() -> InlineKeyboardMarkup:
+_BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def to_base36(number: int) -> str:
+    digits = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        digits = _BASE36[remainder] + digits
+        if not number:
+            return digits
+
+
+def suit_callback(suit_name) -> str:
+    return f"s{CALLBACK_VERSION}:{card_registry.SUITS.index(suit_name)}"
+
+
+def card_callback(card) -> str:
+    return f"c{CALLBACK_VERSION}:{to_base36(card.id)}"
+
+
+BACK_CALLBACK = f"s{CALLBACK_VERSION}:b"
+BACK = object()
+
+
+def parse_suit_callback(data):
     """
-    Клавиатура для выбора масти (нижнее сообщение).
+    Масть из callback_data, BACK для «Назад к мастям» или None, если кнопка устарела.
+    Понимает и прежний формат suit_<масть> из сообщений, отправленных до смены формата.
     """
+    if data.startswith('suit_'):
+        value = data[len('suit_'):]
+        if value == 'back':
+            return BACK
+        return value if value in card_registry.BY_SUIT else None
+    tag, _, value = data.partition(':')
+    if tag != f"s{CALLBACK_VERSION}":
+        return None
+    if value == 'b':
+        return BACK
+    if value.isdigit() and int(value) < len(card_registry.SUITS):
+        return card_registry.SUITS[int(value)]
+    return None
+
+
+def parse_card_callback(data):
+    """
+    Карта из callback_data или None, если кнопка устарела.
+    Прежний формат card_<название> тоже понимается.
+    """
+    if data.startswith('card_'):
+        return card_registry.get(data[len('card_'):])
+    tag, _, value = data.partition(':')
+    if tag != f"c{CALLBACK_VERSION}":
+        return None
+    try:
+        return card_registry.by_id(int(value, 36))
+    except ValueError:
+        return None
+
+
+def _build_suits_keyboard() -> InlineKeyboardMarkup:
     keyboard = [
         [
-            InlineKeyboardButton("🧿 Пентакли 🧿", callback_data='suit_Pentacles'),
-            InlineKeyboardButton("🌿 Жезлы 🌿", callback_data='suit_Wands'),
+            InlineKeyboardButton("🧿 Пентакли 🧿", callback_data=suit_callback('Pentacles')),
+            InlineKeyboardButton("🌿 Жезлы 🌿", callback_data=suit_callback('Wands')),
         ],
         [
-            InlineKeyboardButton("🍷 Кубки 🍷", callback_data='suit_Cups'),
-            InlineKeyboardButton("⚔️ Мечи ⚔️", callback_data='suit_Swords'),
+            InlineKeyboardButton("🍷 Кубки 🍷", callback_data=suit_callback('Cups')),
+            InlineKeyboardButton("⚔️ Мечи ⚔️", callback_data=suit_callback('Swords')),
         ],
         [
-            InlineKeyboardButton("👑 Старшие Арканы 👑", callback_data='suit_Major'),
+            InlineKeyboardButton("👑 Старшие Арканы 👑", callback_data=suit_callback('Major')),
         ],
     ]
     return InlineKeyboardMarkup(keyboard)
 
 
-def create_card_buttons(suit_name: str) -> InlineKeyboardMarkup:
-    """
-    Создаёт инлайн-клавиатуру со списком карт выбранной масти.
-    """
-    if suit_name not in SUITS:
-        # Если масть не найдена, вернём клавиатуру мастей.
-        return suits_keyboard()
-
-    cards_in_suit = SUITS[suit_name]
+def _build_card_buttons(suit_name: str) -> InlineKeyboardMarkup:
     keyboard = []
     row = []
-    for idx, card_name in enumerate(cards_in_suit):
-        row.append(InlineKeyboardButton(card_name, callback_data=f'card_{card_name}'))
+    for idx, card in enumerate(card_registry.BY_SUIT[suit_name]):
+        row.append(InlineKeyboardButton(card.name, callback_data=card_callback(card)))
         if (idx + 1) % 3 == 0:
             keyboard.append(row)
             row = []
@@ -95,10 +113,87 @@ def create_card_buttons(suit_name: str) -> InlineKeyboardMarkup:
         keyboard.append(row)
 
     # «Назад к мастям»
-    keyboard.append([InlineKeyboardButton("⬅ Назад к мастям", callback_data='suit_back')])
+    keyboard.append([InlineKeyboardButton("⬅ Назад к мастям", callback_data=BACK_CALLBACK)])
     return InlineKeyboardMarkup(keyboard)
 
 
+# Клавиатуры неизменны — собираем один раз
+SUITS_KEYBOARD = _build_suits_keyboard()
+CARD_KEYBOARDS = {suit: _build_card_buttons(suit) for suit in card_registry.SUITS}
+
+
+def suits_keyboard() -> InlineKeyboardMarkup:
+    """
+    Клавиатура для выбора масти (нижнее сообщение).
+    """
+    return SUITS_KEYBOARD
+
+
+def create_card_buttons(suit_name: str) -> InlineKeyboardMarkup:
+    """
+    Инлайн-клавиатура со списком карт выбранной масти.
+    """
+    # Если масть не найдена, вернём клавиатуру мастей.
+    return CARD_KEYBOARDS.get(suit_name, SUITS_KEYBOARD)
+
+
+# Для свободного текста длиннее этого поиск не запускаем — это явно не название карты
+SEARCH_MAX_QUERY = 64
+SEARCH_LIMIT = 6
+# Для текста, набранного вне /find, нужна уверенная находка: название карты целиком (см. card_index.search)
+FREE_TEXT_MIN_SCORE = 0.5
+
+
+def search_keyboard(results) -> InlineKeyboardMarkup:
+    """
+    Найденные карты — по одной кнопке в строке, те же callback_data, что и у кнопок мастей.
+    """
+    return InlineKeyboardMarkup([[InlineKeyboardButton(card.name, callback_data=card_callback(card))]
+                                 for card, _ in results])
+
+
+async def search_cards(update: Update, context: ContextTypes.DEFAULT_TYPE, query: str, min_score: float = 0.0,
+                       whole_name: bool = False) -> bool:
+    """
+    Ищет карты по тексту и отвечает списком кнопок. Возвращает False, если ничего не нашлось.
+    """
+    if len(query) > SEARCH_MAX_QUERY:
+        return False
+    results = [(card, score) for card, score in card_index.search(query, limit=SEARCH_LIMIT, whole_name=whole_name)
+               if score >= min_score]
+    if not results:
+        return False
+    user = update.message.from_user
+    logger.info(f"Пользователь {user.username} ({user.id}) искал «{query}»: найдено {len(results)}.")
+    # Карта откроется новым сообщением, а не заменит верхнее сообщение прошлого поиска по мастям
+    context.user_data.pop("card_message_id", None)
+    await update.message.reply_text("🔍 Вот что нашлось:", reply_markup=search_keyboard(results))
+    return True
+
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /find <текст> — поиск карты по названию (можно с опечаткой) или слову из значения.
+    """
+    query = ' '.join(context.args or [])
+    if not query:
+        await update.message.reply_text("Напишите, что искать: /find королева пентаклей")
+        return
+    if not await search_cards(update, context, query):
+        await update.message.reply_text("Ничего не нашлось. Попробуйте иначе или выберите карту по масти: 🔍 Поиск карты")
+
+
+async def _stale_button(query):
+    """
+    Кнопка из старого сообщения, которую уже не разобрать: предлагаем выбрать заново.
+    """
+    await query.answer("Эта кнопка устарела — выберите масть заново.")
+    try:
+        await query.edit_message_text(text="Выберите масть:", reply_markup=SUITS_KEYBOARD)
+    except BadRequest as e:
+        logger.warning(f"Не удалось обновить сообщение с устаревшей кнопкой: {e}")
+
+
 async def start_card_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     При команде /start_card_search отправляем:
@@ -129,20 +224,21 @@ async def handle_suit_selection(update: Update, context: ContextTypes.DEFAULT_TY
     Верхнее сообщение не трогаем.
     """
     query = update.callback_query
+    suit_name = parse_suit_callback(query.data)
+    if suit_name is None:
+        await _stale_button(query)
+        return
     await query.answer()
 
-    data = query.data
-    # Если 'suit_back': вернуться к мастям
-    if data == 'suit_back':
+    # «Назад к мастям»
+    if suit_name is BACK:
         await query.edit_message_text(
             text="Выберите масть:",
-            reply_markup=suits_keyboard()
+            reply_markup=SUITS_KEYBOARD
         )
         return
 
-    # Иначе data = suit_XYZ
-    _, suit_name = data.split('_', 1)
-    new_kb = create_card_buttons(suit_name)
+    new_kb = CARD_KEYBOARDS[suit_name]
 
     # Меняем нижнее сообщение
     await query.edit_message_text(
@@ -158,20 +254,17 @@ async def handle_card_selection(update: Update, context: ContextTypes.DEFAULT_TY
     Клавиатуру в нижнем сообщении не трогаем, чтобы пользователь мог выбрать другую карту.
     """
     query = update.callback_query
-    await query.answer()
-
-    # card_Туз Пентаклей
-    _, card_name = query.data.split('_', 1)
-    card_info = cards.get(card_name)
-
-    if not card_info:
-        await query.message.reply_text(f"Информация о карте «{card_name}» не найдена.")
+    card = parse_card_callback(query.data)
+    if card is None:
+        await _stale_button(query)
         return
+    await query.answer()
+    card_name = card.name
 
     # Формируем текст
-    description = card_info.get("description", "Описание отсутствует.")
-    advice = card_info.get("advice", "")
-    image_file = card_info.get("image_file", "")
+    description = card.description or "Описание отсутствует."
+    advice = card.advice
+    image_file = card.image_file
 
     caption = (
         f"🃏 {card_name}\n\n"
@@ -180,35 +273,25 @@ async def handle_card_selection(update: Update, context: ContextTypes.DEFAULT_TY
     )
 
     # Ищем message_id верхнего сообщения
+    # (его нет после поиска текстом или если старт бота был другим — тогда просто отправляем новое)
     top_msg_id = context.user_data.get("card_message_id")
-    if not top_msg_id:
-        # На случай, если старт бота был другим
-        await query.message.reply_text(caption)
-        return
 
     chat_id = query.message.chat_id
 
-    # Путь к изображению
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    image_path = os.path.join(base_dir, 'images', image_file)
+    # Путь к изображению (подготовленная копия, если собрана)
+    image_path = card_images.image_path(image_file)
 
     # 1) Удаляем старое верхнее сообщение
     #    (т.к. оно было текстом, а мы хотим новое фото-сообщение)
-    from telegram.error import BadRequest
-    try:
-        await context.bot.delete_message(chat_id, top_msg_id)
-    except BadRequest as e:
-        logger.warning(f"Не удалось удалить старое верхнее сообщение ID={top_msg_id}: {e}")
-
-    # 2) Отправляем новое верхнее сообщение (фото или текст)
-    if os.path.exists(image_path):
-        with open(image_path, 'rb') as photo:
-            new_msg = await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=photo,
-                caption=caption
-            )
-    else:
+    if top_msg_id:
+        try:
+            await context.bot.delete_message(chat_id, top_msg_id)
+        except BadRequest as e:
+            logger.warning(f"Не удалось удалить старое верхнее сообщение ID={top_msg_id}: {e}")
+
+    # 2) Отправляем новое верхнее сообщение (фото по file_id или текст, если картинки нет)
+    new_msg = await telegram_files.send_photo(context.bot, chat_id, image_path, caption=caption)
+    if new_msg is None:
         new_msg = await context.bot.send_message(chat_id=chat_id, text=caption)
 
     # 3) Запоминаем новое message_id в user_data, 
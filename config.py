@@ -5,3 +5,106 @@ TELEGRAM_BOT_TOKEN = '7511422141:AAEKOUXryQ0C8xf77uEYJcC9abj_e-lVpMk'
 
 # Telegram ID администратора для получения отзывов
 ADMIN_TELEGRAM_IDS = [334124671,7652470369,7484357361]  
+
+
+# Файл базы данных
+DB_PATH = 'user_data.db'
+
+# Режим хранения: 'wal' — WAL, настроенные PRAGMA и групповая фиксация записей;
+# 'legacy' — журнал отката и отдельный commit на каждый запрос
+DB_STORAGE_MODE = 'wal'
+
+# Окно групповой фиксации записей в режиме 'wal', мс
+DB_GROUP_COMMIT_MS = 5
+
+# Кэш статуса подписки: время жизни записи (с) и максимальное число пользователей
+SUBSCRIPTION_CACHE_TTL = 600
+SUBSCRIPTION_CACHE_SIZE = 10000
+
+# Ежедневная рассылка: параллельных доставок, общий лимит сообщений/с и лимит на один чат
+BROADCAST_CONCURRENCY = 20
+BROADCAST_GLOBAL_RATE = 25
+BROADCAST_PER_CHAT_RATE = 1
+# Размер порции при чтении подписчиков для рассылки
+BROADCAST_CHUNK_SIZE = 500
+
+# Журнал доставки: попыток на получателя, базовая задержка повтора (с, удваивается),
+# период прохода повторов (с), его параллельность и лимит сообщений/с
+DELIVERY_MAX_ATTEMPTS = 5
+DELIVERY_RETRY_BACKOFF = 60
+DELIVERY_RETRY_INTERVAL = 300
+DELIVERY_RETRY_CONCURRENCY = 2
+DELIVERY_RETRY_RATE = 5
+
+# Подготовка карт дня заранее: час запуска (по Москве) и число параллельных AI-запросов
+PREGEN_HOUR = 3
+PREGEN_CONCURRENCY = 4
+
+# AI-советы: адрес API (переменная окружения AI_BASE_URL его переопределяет), модель,
+# таймаут одного запроса (с), одновременных запросов и соединений в пуле
+AI_BASE_URL = 'https://api.langdock.com/openai/eu/v1'
+AI_MODEL = 'gpt-4o'
+AI_TIMEOUT = 30
+AI_MAX_CONCURRENCY = 8
+AI_MAX_CONNECTIONS = 16
+
+# Кэш AI-советов: вариантов текста на (карту, положение, знак) и срок жизни текста (с)
+AI_CACHE_VARIANTS = 3
+AI_CACHE_TTL = 30 * 24 * 3600
+
+# Потоковый AI-совет в карте дня: картинка сразу, текст дописывается правками сообщения
+# не чаще раза в AI_STREAM_EDIT_INTERVAL секунд (лимиты Telegram на правки)
+AI_STREAMING = True
+AI_STREAM_EDIT_INTERVAL = 1.5
+
+# Защита AI-запросов: бюджет задержки одного совета (с), после скольких неудач подряд
+# размыкатель перестаёт спрашивать модель и на сколько секунд; дублирующий запрос
+# после p95 задержки (включается AI_HEDGE, нужно не меньше AI_HEDGE_MIN_SAMPLES замеров)
+AI_LATENCY_BUDGET = 10
+AI_BREAKER_FAILURES = 5
+AI_BREAKER_COOLDOWN = 60
+AI_HEDGE = False
+AI_HEDGE_MIN_SAMPLES = 20
+
+# Подготовленные картинки карт (card_images.py): каталог относительно бота,
+# наибольшая сторона (Telegram показывает фото до 1280 px; меньшие не увеличиваются) и качество JPEG
+IMAGE_CACHE_DIR = 'images/cache'
+IMAGE_MAX_SIDE = 1280
+IMAGE_QUALITY = 85
+
+# Картинки раскладов (spreads.py) хранятся в IMAGE_CACHE_DIR/spreads; сколько файлов держать (LRU)
+SPREAD_CACHE_MAX_FILES = 2000
+
+# Параллельная обработка апдейтов: сколько апдейтов разных пользователей обрабатываются
+# одновременно (1 — по очереди, как раньше) и сколько ещё могут ждать своей очереди.
+# Апдейты одного пользователя всегда идут строго по порядку; больше
+# CONCURRENT_UPDATES_PER_USER его апдейтов сразу (в работе и в очереди) не держим — лишние отбрасываются.
+CONCURRENT_UPDATES = 32
+CONCURRENT_UPDATES_QUEUE = 256
+CONCURRENT_UPDATES_PER_USER = 8
+
+# Состояние бота (user_data, chat_data, шаг регистрации) в базе: раз во сколько секунд
+# изменения записываются одной транзакцией (при остановке бота — сразу)
+PERSISTENCE_UPDATE_INTERVAL = 30
+
+# user_data в памяти (user_state.py): сколько пользователей держать и через сколько секунд
+# простоя выгружать в базу (при следующем сообщении пользователь читается обратно)
+USER_STATE_MAX_USERS = 10000
+USER_STATE_TTL = 6 * 3600
+
+# Получение апдейтов: 'polling' — бот сам опрашивает Telegram (getUpdates);
+# 'webhook' — Telegram присылает апдейты на WEBHOOK_URL (нужен публичный https-адрес и reverse proxy,
+# проксирующий его на WEBHOOK_LISTEN:WEBHOOK_PORT)
+UPDATE_MODE = 'polling'
+WEBHOOK_URL = ''
+WEBHOOK_LISTEN = '127.0.0.1'
+WEBHOOK_PORT = 8443
+# Секрет в заголовке X-Telegram-Bot-Api-Secret-Token; пустой — случайный при каждом запуске
+# (переменная окружения WEBHOOK_SECRET его переопределяет)
+WEBHOOK_SECRET = ''
+# Одновременных соединений от Telegram (1–100), задач разбора апдейтов и размер их очереди
+# (только ещё не разобранные апдейты), через сколько секунд закрывать молчащее соединение
+WEBHOOK_MAX_CONNECTIONS = 40
+WEBHOOK_WORKERS = 4
+WEBHOOK_QUEUE = 1000
+WEBHOOK_IDLE_TIMEOUT = 60
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+
+logger = logging.getLogger(__name__)
+
+# Даты в базе хранятся как целые epoch-секунды (локальное время бота)
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+
+def to_epoch(value):
+    """
+    Переводит дату в epoch-секунды: datetime, date или строку в одном из DATE_FORMATS.
+    Для пустых и нераспознанных значений возвращает None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime.combine(value, time.min).timestamp())
+    for fmt in DATE_FORMATS:
+        try:
+            return int(datetime.strptime(str(value), fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+def day_start_epoch(day: date) -> int:
+    return int(datetime.combine(day, time.min).timestamp())
+
+
+def format_epoch(value, fmt='%Y-%m-%d %H:%M:%S'):
+    if value is None:
+        return ''
+    return datetime.fromtimestamp(value).strftime(fmt)
+
+
+# PRAGMA для режима 'wal': WAL-журнал читает параллельно с записью,
+# synchronous=NORMAL делает fsync только на контрольных точках
+WAL_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+
+class Database:
+    """
+    Асинхронный доступ к SQLite.
+    Каждый запрос выполняется в пуле потоков на отдельном курсоре,
+    поэтому обработчики не блокируют цикл событий и не делят один общий курсор.
+
+    mode='legacy' — журнал отката и фиксация каждого запроса по отдельности.
+    mode='wal' — WAL с настроенными PRAGMA; все записи идут через одну задачу-писателя,
+    которая раз в group_commit_ms собирает запросы разных обработчиков в одну транзакцию.
+    """
+
+    def __init__(self, path: str, max_workers: int = 4, timeout: float = 30.0,
+                 mode: str = 'legacy', group_commit_ms: float = 5.0, max_batch: int = 500):
+        if mode not in ('legacy', 'wal'):
+            raise ValueError(f"Неизвестный режим хранения: {mode}")
+        self.path = path
+        self.timeout = timeout
+        self.mode = mode
+        self.group_commit_ms = group_commit_ms
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+        # Отдельный поток для писателя: одно соединение на запись, без борьбы за блокировку
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._write_queue = None
+        self._writer_task = None
+        self.batches_committed = 0
+        self.writes_committed = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Одно соединение на поток пула: sqlite3 не любит делить соединение между потоками
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            if self.mode == 'wal':
+                for pragma in WAL_PRAGMAS:
+                    conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def run_sync(self, func, *args):
+        """
+        Выполняет func(conn, *args) в текущем потоке.
+        Нужен только на старте, пока цикл событий ещё не запущен.
+        """
+        return func(self._connection(), *args)
+
+    async def run(self, func, *args):
+        """
+        Выполняет func(conn, *args) в пуле потоков и возвращает результат.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.run_sync, func, *args)
+
+    @staticmethod
+    def _fetchone(conn, sql, params):
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchone()
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _fetchall(conn, sql, params):
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _transaction(conn, statements):
+        cur = conn.cursor()
+        try:
+            with conn:
+                rowcount = 0
+                for sql, params in statements:
+                    cur.execute(sql, params)
+                    rowcount += max(cur.rowcount, 0)
+            return rowcount
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _commit_batch(conn, jobs):
+        """
+        Фиксирует пачку заданий одной транзакцией.
+        Каждое задание — в своём SAVEPOINT, чтобы ошибка одного не откатывала остальные.
+        """
+        results = []
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN")
+            for statements in jobs:
+                cur.execute("SAVEPOINT job")
+                try:
+                    rowcount = 0
+                    for sql, params in statements:
+                        cur.execute(sql, params)
+                        rowcount += max(cur.rowcount, 0)
+                    cur.execute("RELEASE job")
+                    results.append(rowcount)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO job")
+                    cur.execute("RELEASE job")
+                    results.append(e)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+        return results
+
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        task = self._writer_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._write_queue = asyncio.Queue()
+            self._writer_task = loop.create_task(self._writer())
+        return self._write_queue
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        queue = self._write_queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                return
+            batch = [item]
+            # Окно группировки: даём другим обработчикам добавить свои записи
+            await asyncio.sleep(self.group_commit_ms / 1000)
+            while len(batch) < self.max_batch and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            jobs = [statements for statements, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self._write_executor, self.run_sync, self._commit_batch, jobs
+                )
+            except Exception as e:
+                logger.error(f"Ошибка групповой фиксации ({len(batch)} заданий): {e}")
+                results = [e] * len(batch)
+            else:
+                self.batches_committed += 1
+                self.writes_committed += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.run(self._fetchone, sql, params)
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.run(self._fetchall, sql, params)
+
+    async def execute(self, sql: str, params=()) -> int:
+        """
+        Выполняет один изменяющий запрос и фиксирует его. Возвращает rowcount.
+        """
+        return await self.transaction([(sql, params)])
+
+    async def transaction(self, statements) -> int:
+        """
+        Выполняет список (sql, params) атомарно.
+        В режиме 'wal' задание уходит писателю и фиксируется вместе с чужими заданиями.
+        """
+        statements = list(statements)
+        if self.mode != 'wal':
+            return await self.run(self._transaction, statements)
+        queue = self._ensure_writer()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((statements, future))
+        return await future
+
+    async def stop_writer(self):
+        """
+        Дожидается фиксации очереди записей и останавливает писателя.
+        """
+        task = self._writer_task
+        if task is None or task.done():
+            return
+        # None — признак остановки: всё, что стоит в очереди до него, будет зафиксировано
+        await self._write_queue.put(None)
+        await task
+        self._writer_task = None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Не удалось закрыть соединение с БД: {e}")
+            self._connections.clear()
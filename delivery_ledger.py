@@ -0,0 +1,159 @@
+import json
+import logging
+import time
+
+from telegram.error import Forbidden
+
+logger = logging.getLogger(__name__)
+
+# Состояния доставки в таблице deliveries
+QUEUED = 'queued'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class Delivery:
+    """
+    Одна доставка из журнала. deliver сохраняет в payload то, что уже сделано
+    (например, вытянутую карту), и повторная попытка продолжает с этого места.
+    """
+    __slots__ = ('db', 'user_id', 'day', 'payload')
+
+    def __init__(self, db, user_id, day, payload=None):
+        self.db = db
+        self.user_id = user_id
+        self.day = day
+        self.payload = payload or {}
+
+    def save_statement(self, **changes):
+        """
+        Запрос, сохраняющий изменения payload, — чтобы записать их одной транзакцией с другими данными.
+        """
+        self.payload.update(changes)
+        return (
+            "UPDATE deliveries SET payload = ? WHERE user_id = ? AND day = ?",
+            (json.dumps(self.payload, ensure_ascii=False), self.user_id, self.day)
+        )
+
+    async def save(self, **changes):
+        await self.db.execute(*self.save_statement(**changes))
+
+
+class DeliveryLedger:
+    """
+    Журнал доставки рассылки по ключу (user_id, day).
+    Рассылка сначала ставит всех получателей дня в очередь, затем отправляет только queued:
+    после перезапуска бот продолжает с оставшихся и не шлёт повторно тем, кто уже в sent.
+    Неудачные доставки переходят в failed и повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, db, max_attempts: int = 5, base_backoff: float = 60.0, chunk_size: int = 500):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.chunk_size = chunk_size
+
+    async def enqueue(self, day, user_ids):
+        """
+        Ставит получателей дня в очередь. Уже записанные (в любом состоянии) не трогает,
+        поэтому повторный вызов после сбоя безопасен.
+        """
+        added = 0
+        chunk = []
+        async for user_id in user_ids:
+            chunk.append(user_id)
+            if len(chunk) >= self.chunk_size:
+                added += await self._insert(day, chunk)
+                chunk = []
+        if chunk:
+            added += await self._insert(day, chunk)
+        return added
+
+    async def _insert(self, day, user_ids):
+        now = int(time.time())
+        return await self.db.transaction([
+            ("INSERT OR IGNORE INTO deliveries (user_id, day, state, updated_at) VALUES (?, ?, ?, ?)",
+             (user_id, day, QUEUED, now))
+            for user_id in user_ids
+        ])
+
+    async def _iter_state(self, day, state, extra_sql='', extra_params=()):
+        last_user_id = 0
+        while True:
+            rows = await self.db.fetchall(
+                "SELECT user_id FROM deliveries WHERE day = ? AND state = ? AND user_id > ?"
+                f"{extra_sql} ORDER BY user_id LIMIT ?",
+                (day, state, last_user_id, *extra_params, self.chunk_size)
+            )
+            for (user_id,) in rows:
+                yield user_id
+            if len(rows) < self.chunk_size:
+                return
+            last_user_id = rows[-1][0]
+
+    def iter_queued(self, day):
+        return self._iter_state(day, QUEUED)
+
+    def iter_retryable(self, day):
+        """
+        Неудачные доставки дня, у которых подошло время повтора и не исчерпаны попытки.
+        """
+        return self._iter_state(
+            day, FAILED,
+            " AND attempts < ? AND next_attempt_at <= ?",
+            (self.max_attempts, int(time.time()))
+        )
+
+    async def delivery(self, user_id, day):
+        row = await self.db.fetchone(
+            "SELECT payload FROM deliveries WHERE user_id = ? AND day = ?", (user_id, day)
+        )
+        return Delivery(self.db, user_id, day, json.loads(row[0]) if row and row[0] else None)
+
+    async def mark_sent(self, user_id, day):
+        # payload нужен только для повторов — после доставки он больше не понадобится
+        await self.db.execute(
+            "UPDATE deliveries SET state = ?, last_error = NULL, payload = NULL, updated_at = ? "
+            "WHERE user_id = ? AND day = ?",
+            (SENT, int(time.time()), user_id, day)
+        )
+
+    async def mark_failed(self, user_id, day, error, permanent=False):
+        row = await self.db.fetchone(
+            "SELECT attempts FROM deliveries WHERE user_id = ? AND day = ?", (user_id, day)
+        )
+        attempts = (row[0] if row else 0) + 1
+        if permanent:
+            attempts = max(attempts, self.max_attempts)
+        now = int(time.time())
+        next_attempt_at = now + int(self.base_backoff * 2 ** (attempts - 1))
+        await self.db.execute(
+            "UPDATE deliveries SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+            "WHERE user_id = ? AND day = ?",
+            (FAILED, attempts, next_attempt_at, str(error)[:500], now, user_id, day)
+        )
+
+    async def counts(self, day):
+        rows = await self.db.fetchall(
+            "SELECT state, COUNT(*) FROM deliveries WHERE day = ? GROUP BY state", (day,)
+        )
+        result = {QUEUED: 0, SENT: 0, FAILED: 0}
+        result.update(dict(rows))
+        return result
+
+    def tracked(self, deliver, day):
+        """
+        Оборачивает deliver(bot, user_id, delivery): успех отмечается как sent, ошибка — как failed.
+        delivery (Delivery) хранит сделанное прошлыми попытками.
+        Пользователь, заблокировавший бота, сразу получает все попытки — повторять бессмысленно.
+        """
+        async def deliver_tracked(bot, user_id):
+            delivery = await self.delivery(user_id, day)
+            try:
+                result = await deliver(bot, user_id, delivery)
+            except Exception as e:
+                await self.mark_failed(user_id, day, e, permanent=isinstance(e, Forbidden))
+                raise
+            await self.mark_sent(user_id, day)
+            return result
+        return deliver_tracked
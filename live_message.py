@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Предел длины текста сообщения в Telegram (в UTF-16 единицах)
+TELEGRAM_TEXT_LIMIT = 4096
+
+
+def telegram_length(text):
+    """
+    Длина текста так, как её считает Telegram: эмодзи вне BMP занимают две единицы.
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_text(text, limit=TELEGRAM_TEXT_LIMIT):
+    """
+    Делит text на (голова, хвост) так, чтобы голова помещалась в limit.
+    Режет по абзацу, строке или пробелу во второй половине головы, иначе — посимвольно.
+    """
+    if telegram_length(text) <= limit:
+        return text, ''
+    size = 0
+    cut = len(text)
+    for i, char in enumerate(text):
+        size += 2 if ord(char) > 0xFFFF else 1
+        if size > limit:
+            cut = i
+            break
+    for separator in ('\n\n', '\n', ' '):
+        position = text.rfind(separator, 0, cut)
+        if position > cut // 2:
+            return text[:position].rstrip(), text[position:].lstrip()
+    return text[:cut], text[cut:]
+
+
+class LiveMessage:
+    """
+    Сообщение, которое дописывается по мере поступления текста (потоковый AI-совет).
+
+    Правки идут не чаще раза в min_interval секунд: промежуточные правки, попавшие
+    в паузу, пропускаются, а последний текст всё равно будет показан при следующей
+    правке или в finish(). Если текст перерастает лимит Telegram, текущее сообщение
+    дописывается до границы абзаца и продолжение уходит новым сообщением.
+    """
+
+    def __init__(self, bot, chat_id, min_interval: float = 1.5, cursor=' ⏳',
+                 parse_mode='Markdown', limit: int = TELEGRAM_TEXT_LIMIT):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.cursor = cursor
+        self.parse_mode = parse_mode
+        self.limit = limit
+        self.text = ''          # текст текущего (последнего) сообщения
+        self.message_id = None
+        self.messages = 0
+        self.edits = 0
+        self.skipped_edits = 0
+        self._shown = None      # что сейчас видно в текущем сообщении
+        self._plain = False     # разметка не разобралась — промежуточные правки без неё
+        self._next_edit = 0.0
+
+    async def start(self, text):
+        self.text = text
+        await self._send_new(self.text + self.cursor)
+
+    async def append(self, chunk):
+        self.text += chunk
+        await self._roll_over(self.cursor)
+        await self._edit(self.text + self.cursor, force=False)
+
+    async def finish(self, tail=''):
+        self.text += tail
+        await self._roll_over('')
+        await self._edit(self.text, force=True)
+
+    async def _roll_over(self, cursor):
+        while telegram_length(self.text + cursor) > self.limit:
+            head, rest = split_text(self.text, self.limit - telegram_length(cursor))
+            self.text = head
+            await self._edit(head, force=True)
+            self.text = rest
+            await self._send_new(self.text + cursor)
+
+    async def _send_new(self, text):
+        self._plain = False
+        message = await self._call(self.bot.send_message, chat_id=self.chat_id, text=text)
+        self.message_id = message.message_id
+        self.messages += 1
+        self._shown = text
+        self._next_edit = time.monotonic() + self.min_interval
+
+    async def _edit(self, text, force):
+        if text == self._shown:
+            return
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            if not force:
+                self.skipped_edits += 1
+                return
+            await asyncio.sleep(delay)
+        try:
+            await self._call(self.bot.edit_message_text, chat_id=self.chat_id, message_id=self.message_id,
+                             text=text, plain=self._plain and not force)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Telegram просит подождать {retry_after} с перед правкой (чат {self.chat_id}).")
+            if not force:
+                self._next_edit = time.monotonic() + retry_after
+                self.skipped_edits += 1
+                return
+            await asyncio.sleep(retry_after)
+            return await self._edit(text, force)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                raise
+        self.edits += 1
+        self._shown = text
+        self._next_edit = time.monotonic() + self.min_interval
+
+    async def _call(self, method, plain=False, **kwargs):
+        """
+        Вызов с разметкой; если Telegram не разобрал её (незакрытая * в середине потока),
+        повторяет без разметки и до конца сообщения правит простым текстом.
+        """
+        if self.parse_mode and not plain:
+            try:
+                return await method(parse_mode=self.parse_mode, **kwargs)
+            except BadRequest as e:
+                if "parse entities" not in str(e).lower():
+                    raise
+                self._plain = True
+        return await method(**kwargs)
@@ -1,11 +1,11 @@
+import asyncio
+import functools
 import logging
 import os
-import sqlite3
 import pytz
-import types
 from datetime import datetime, time, timedelta
 
-from telegram import Update, ReplyKeyboardRemove, InputFile, ReplyKeyboardMarkup
+from telegram import Update, ReplyKeyboardRemove, InputFile
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -17,14 +17,42 @@ from telegram.ext import (
 )
 
 from config import TELEGRAM_BOT_TOKEN, ADMIN_TELEGRAM_IDS  # Список ID админов
-from ai_utils import get_ai_description
+from config import DB_PATH, DB_STORAGE_MODE, DB_GROUP_COMMIT_MS
+from config import SUBSCRIPTION_CACHE_TTL, SUBSCRIPTION_CACHE_SIZE
+from config import BROADCAST_CONCURRENCY, BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE, BROADCAST_CHUNK_SIZE
+from config import DELIVERY_MAX_ATTEMPTS, DELIVERY_RETRY_BACKOFF, DELIVERY_RETRY_INTERVAL
+from config import DELIVERY_RETRY_CONCURRENCY, DELIVERY_RETRY_RATE
+from config import PREGEN_HOUR, PREGEN_CONCURRENCY
+from config import AI_CACHE_VARIANTS, AI_CACHE_TTL
+from config import CONCURRENT_UPDATES, CONCURRENT_UPDATES_QUEUE, CONCURRENT_UPDATES_PER_USER
+from config import PERSISTENCE_UPDATE_INTERVAL, USER_STATE_MAX_USERS, USER_STATE_TTL
+from config import UPDATE_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET
+from config import WEBHOOK_MAX_CONNECTIONS, WEBHOOK_WORKERS, WEBHOOK_QUEUE, WEBHOOK_IDLE_TIMEOUT
+import ai_utils
+from ai_utils import close_ai_client
+from broadcast import Broadcaster, last_reports
+from db import Database, day_start_epoch, format_epoch
+from delivery_ledger import DeliveryLedger, QUEUED, SENT, FAILED
+from migrations import run_migrations
+import subscriptions
+import telegram_files
+import card_images
+import card_registry
+import spreads
+from persistence import SQLitePersistence
+from router import Router
+from update_processing import PerUserUpdateProcessor
+from user_state import TaroApplication
+from webhook import WebhookServer, run_webhook, webhook_path
 from personal_account import (
     personal_account,
     get_zodiac_sign,
+    main_menu_keyboard,
     initialize_db as initialize_personal_account_db,
 )
 from menu_functions import (
-    daily_card,
+    deliver_daily_card,
+    stage_daily_card,
     send_news,
     show_history,
     subscribe,
@@ -32,14 +60,17 @@ from menu_functions import (
     settings_menu,
     settings_menu_keyboard,
     main_menu,
-    handle_message,
+    handle_free_text,
+    MENU_ROUTES,
     request_feedback,
     initialize_menu_functions
 )
 from card_search import (
-    start_card_search,
     handle_suit_selection,
-    handle_card_selection
+    handle_card_selection,
+    find_command,
+    SUIT_PATTERN,
+    CARD_PATTERN
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -58,79 +89,53 @@ console_handler = logging.StreamHandler()
 console_handler.setFormatter(log_formatter)
 
 logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler])
+# httpx пишет INFO-строку на каждый запрос к Bot API, в том числе на каждый getUpdates
+logging.getLogger('httpx').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-conn = sqlite3.connect('user_data.db', check_same_thread=False)
-cursor = conn.cursor()
-
-# Создание таблиц
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS history (
-        user_id INTEGER,
-        date TEXT,
-        card TEXT,
-        is_reversed INTEGER,
-        type TEXT DEFAULT 'daily_card'
-    )
-''')
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS subscriptions (
-        user_id INTEGER PRIMARY KEY,
-        expires_at TEXT
-    )
-''')
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        nickname TEXT,
-        birth_date TEXT,
-        zodiac_sign TEXT,
-        avatar TEXT,
-        total_cards INTEGER DEFAULT 0,
-        straight_cards INTEGER DEFAULT 0,
-        reversed_cards INTEGER DEFAULT 0,
-        consecutive_days INTEGER DEFAULT 0,
-        last_card_date TEXT
-    )
-''')
-
-# Добавление колонки expires_at, если её нет
-try:
-    cursor.execute("ALTER TABLE subscriptions ADD COLUMN expires_at TEXT")
-except sqlite3.OperationalError:
-    pass
-
-conn.commit()
-initialize_personal_account_db(conn, cursor)
-initialize_menu_functions(conn, cursor, BASE_DIR)
+db = Database(DB_PATH, mode=DB_STORAGE_MODE, group_commit_ms=DB_GROUP_COMMIT_MS)
+# Схема базы: применяем недостающие миграции
+db.run_sync(run_migrations)
+subscriptions.initialize_subscriptions(db, ttl=SUBSCRIPTION_CACHE_TTL, max_size=SUBSCRIPTION_CACHE_SIZE)
+ai_utils.initialize_advice_cache(db, variants=AI_CACHE_VARIANTS, ttl=AI_CACHE_TTL)
+telegram_files.initialize_telegram_files(db, BASE_DIR)
+# Дособираем уменьшенные и повёрнутые картинки карт (если установлен Pillow)
+card_images.initialize_card_images(BASE_DIR)
+spreads.initialize_spreads(BASE_DIR)
+ledger = DeliveryLedger(
+    db,
+    max_attempts=DELIVERY_MAX_ATTEMPTS,
+    base_backoff=DELIVERY_RETRY_BACKOFF,
+    chunk_size=BROADCAST_CHUNK_SIZE,
+)
+initialize_personal_account_db(db)
+initialize_menu_functions(db, BASE_DIR)
+# user_data и шаг регистрации переживают перезапуск
+persistence = SQLitePersistence(db, update_interval=PERSISTENCE_UPDATE_INTERVAL)
 
 ASK_NICKNAME, ASK_BIRTHDATE = range(2)
 
-def main_menu_keyboard(user_id=None):
-    buttons = [
-        ['🃏 Карта дня', '📜 История'],
-        ['📰 Новости', '⚙️ Настройки'],
-        ['🔍 Поиск карты']  
-    ]
-    if user_id:
-        cursor.execute("SELECT 1 FROM subscriptions WHERE user_id = ?", (user_id,))
-        if not cursor.fetchone():
-            buttons.append(['💎 Премиум-доступ'])
-    else:
-        buttons.append(['💎 Премиум-доступ'])
-    buttons.append(['👤 Личный кабинет'])
-    return ReplyKeyboardMarkup(buttons, resize_keyboard=True)
+# Команды и кнопки меню; таблица собирается при запуске (register_routes)
+router = Router()
+# Апдейты разных пользователей — параллельно, одного пользователя — по порядку
+update_processor = (
+    PerUserUpdateProcessor(CONCURRENT_UPDATES, CONCURRENT_UPDATES_QUEUE, CONCURRENT_UPDATES_PER_USER)
+    if CONCURRENT_UPDATES > 1 else None
+)
+# Рассылка карты дня и её повторы идут по одному журналу — не больше одной за раз
+# (например, продолжение после перезапуска и полуденный запуск)
+daily_delivery_lock = asyncio.Lock()
+# Итог последней ночной подготовки карт дня — для админ-панели
+last_pregeneration = None
+# Приём апдейтов в режиме webhook (UPDATE_MODE = 'webhook'), создаётся в main()
+webhook_server = None
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     logger.info(f"Пользователь {user.username} ({user.id}) вызвал команду /start.")
     context.user_data.setdefault('daily_card_date', None)
-    context.user_data['BASE_DIR'] = BASE_DIR
 
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user.id,))
-    user_data = cursor.fetchone()
+    user_data = await db.fetchone("SELECT * FROM users WHERE user_id = ?", (user.id,))
 
     if user_data is None:
         await update.message.reply_text("Здравствуйте! Давайте настроим ваш профиль.",
@@ -140,7 +145,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(
             f"С возвращением, {user_data[1]}!",
-            reply_markup=main_menu_keyboard(user.id)
+            reply_markup=await main_menu_keyboard(user.id)
         )
         return ConversationHandler.END
 
@@ -156,14 +161,13 @@ async def save_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         birthdate = datetime.strptime(birthdate_str, "%d.%m.%Y")
         zodiac_sign = get_zodiac_sign(birthdate.day, birthdate.month)
         nickname = context.user_data['nickname']
-        cursor.execute(
+        await db.execute(
             "INSERT OR REPLACE INTO users (user_id, nickname, birth_date, zodiac_sign) VALUES (?, ?, ?, ?)",
             (user.id, nickname, birthdate_str, zodiac_sign)
         )
-        conn.commit()
         await update.message.reply_text(
             f"Профиль сохранён!\nНик: {nickname}\nДата: {birthdate_str}\nЗнак: {zodiac_sign}",
-            reply_markup=main_menu_keyboard(user.id)
+            reply_markup=await main_menu_keyboard(user.id)
         )
     except ValueError:
         await update.message.reply_text("Неверный формат. Попробуйте ДД.ММ.ГГГГ.")
@@ -172,7 +176,7 @@ async def save_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
-    await update.message.reply_text("Отменено.", reply_markup=main_menu_keyboard(user.id))
+    await update.message.reply_text("Отменено.", reply_markup=await main_menu_keyboard(user.id))
     return ConversationHandler.END
 
 async def feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -186,21 +190,90 @@ async def feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
-    await update.message.reply_text("Неизвестная команда. Используйте меню.", reply_markup=main_menu_keyboard(user.id))
+    await update.message.reply_text("Неизвестная команда. Используйте меню.", reply_markup=await main_menu_keyboard(user.id))
 
 async def send_daily_cards(context: ContextTypes.DEFAULT_TYPE):
-    today = datetime.now().date()
-    cursor.execute("SELECT user_id, expires_at FROM subscriptions")
-    for user_id, expires_at in cursor.fetchall():
-        if expires_at and datetime.strptime(expires_at, "%Y-%m-%d").date() >= today:
-            class DummyMessage:
-                def __init__(self, user_id):
-                    self.chat_id = user_id
-                    self.from_user = types.SimpleNamespace(id=user_id, username='', first_name='')
-                    self.message_id = None
-                    self.text = ''
-            dummy_update = Update(update_id=0, message=DummyMessage(user_id))
-            await daily_card(dummy_update, context)
+    if daily_delivery_lock.locked():
+        logger.info("Рассылка карты дня уже идёт, повторный запуск пропущен.")
+        return
+    async with daily_delivery_lock:
+        day = day_start_epoch(datetime.now().date())
+        _, expired = await subscriptions.count_subscriptions(db)
+        # Журнал идемпотентен: при повторном запуске за день добавятся только новые получатели
+        await ledger.enqueue(day, subscriptions.iter_active_subscribers(db, chunk_size=BROADCAST_CHUNK_SIZE))
+        counts = await ledger.counts(day)
+        if counts[SENT]:
+            logger.info(f"Рассылка за сегодня продолжается: уже доставлено {counts[SENT]}, осталось {counts[QUEUED]}.")
+        broadcaster = Broadcaster(
+            context.bot,
+            concurrency=BROADCAST_CONCURRENCY,
+            global_rate=BROADCAST_GLOBAL_RATE,
+            per_chat_rate=BROADCAST_PER_CHAT_RATE,
+        )
+        await broadcaster.run(
+            ledger.iter_queued(day),
+            ledger.tracked(functools.partial(deliver_daily_card, application=context.application), day),
+            total=counts[QUEUED],
+            skipped=expired,
+            name="Карта дня",
+        )
+
+async def retry_failed_deliveries(context: ContextTypes.DEFAULT_TYPE):
+    # Низкий приоритет: не мешаем основной рассылке (и прошлому повтору) и идём малым числом задач
+    if daily_delivery_lock.locked():
+        return
+    async with daily_delivery_lock:
+        day = day_start_epoch(datetime.now().date())
+        broadcaster = Broadcaster(
+            context.bot,
+            concurrency=DELIVERY_RETRY_CONCURRENCY,
+            global_rate=DELIVERY_RETRY_RATE,
+            per_chat_rate=BROADCAST_PER_CHAT_RATE,
+        )
+        await broadcaster.run(
+            ledger.iter_retryable(day),
+            ledger.tracked(functools.partial(deliver_daily_card, application=context.application), day),
+            name="Повтор карты дня",
+        )
+
+async def pregenerate_daily_cards(context: ContextTypes.DEFAULT_TYPE):
+    # Ночное окно: заранее вытягиваем карты и получаем AI-советы для полуденной рассылки
+    day = day_start_epoch(datetime.now().date())
+    await db.execute("DELETE FROM staged_draws WHERE day < ?", (day,))
+    # Сообщения здесь не отправляются, поэтому без Broadcaster: только ограничиваем число AI-запросов
+    global last_pregeneration
+    semaphore = asyncio.Semaphore(PREGEN_CONCURRENCY)
+    started = datetime.now()
+    counts = {'staged': 0, 'ready': 0, 'failed': 0}
+
+    async def stage(user_id):
+        async with semaphore:
+            try:
+                counts['staged' if await stage_daily_card(user_id) else 'ready'] += 1
+            except Exception as e:
+                counts['failed'] += 1
+                logger.warning(f"Не удалось подготовить карту дня для {user_id}: {e}")
+
+    batch = []
+    async for user_id in subscriptions.iter_active_subscribers(db, chunk_size=BROADCAST_CHUNK_SIZE):
+        batch.append(user_id)
+        if len(batch) >= BROADCAST_CHUNK_SIZE:
+            await asyncio.gather(*(stage(user_id) for user_id in batch))
+            batch = []
+    await asyncio.gather(*(stage(user_id) for user_id in batch))
+    last_pregeneration = (
+        f"подготовлено {counts['staged']}, уже было {counts['ready']}, ошибок {counts['failed']}, "
+        f"{(datetime.now() - started).total_seconds():.1f} с"
+    )
+    logger.info(f"Подготовка карт дня: {last_pregeneration}")
+
+async def resume_daily_cards(app):
+    # Если бот упал посреди рассылки, продолжаем её сразу после запуска
+    day = day_start_epoch(datetime.now().date())
+    counts = await ledger.counts(day)
+    if counts[QUEUED]:
+        logger.info(f"Найдена незавершённая рассылка: в очереди {counts[QUEUED]}, продолжаем.")
+        app.job_queue.run_once(send_daily_cards, when=0)
 
 async def premium_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = (
@@ -232,13 +305,15 @@ async def activate_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.args:
         try:
             user_id = int(context.args[0])
-            expires_at = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
-            cursor.execute("""
+            expires_date = (datetime.now() + timedelta(days=30)).date()
+            expires_at = expires_date.strftime('%Y-%m-%d')
+            expires_epoch = day_start_epoch(expires_date)
+            await db.execute("""
                 INSERT INTO subscriptions (user_id, expires_at)
                 VALUES (?, ?)
                 ON CONFLICT(user_id) DO UPDATE SET expires_at = excluded.expires_at
-            """, (user_id, expires_at))
-            conn.commit()
+            """, (user_id, expires_epoch))
+            subscriptions.cache.set(user_id, expires_epoch)
             await update.message.reply_text(f"✅ Премиум активирован до {expires_at}")
             await context.bot.send_message(user_id, text=f"🎉 Ваша премиум-подписка активирована до {expires_at}")
         except Exception as e:
@@ -252,20 +327,97 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user_id not in ADMIN_TELEGRAM_IDS:
         await update.message.reply_text("⛔ У вас нет доступа.")
         return
-    cursor.execute("SELECT users.user_id, nickname, zodiac_sign, expires_at FROM users JOIN subscriptions ON users.user_id = subscriptions.user_id ORDER BY expires_at DESC")
-    users = cursor.fetchall()
+    users = await db.fetchall("SELECT users.user_id, nickname, zodiac_sign, expires_at FROM users JOIN subscriptions ON users.user_id = subscriptions.user_id ORDER BY expires_at DESC")
     if not users:
         await update.message.reply_text("Нет активных подписчиков.")
         return
-    message = "📋 Подписчики:\n\n"
+    active, expired = await subscriptions.count_subscriptions(db)
+    message = f"📊 Активных подписок: {active}, истёкших: {expired}\n"
+    report = last_reports.get("Карта дня")
+    if report:
+        message += (
+            f"📨 Последняя рассылка: отправлено {report.sent}, ошибок {report.failed}, "
+            f"пропущено истёкших {report.skipped}\n"
+        )
+    if last_pregeneration:
+        message += f"🌙 Подготовка карт дня: {last_pregeneration}\n"
+    counts = await ledger.counts(day_start_epoch(datetime.now().date()))
+    message += f"📬 Сегодня: в очереди {counts[QUEUED]}, доставлено {counts[SENT]}, ошибок {counts[FAILED]}\n"
+    if ai_utils.advice_cache is not None:
+        message += f"🤖 Кэш AI-советов: {ai_utils.advice_cache.summary()}\n"
+    message += f"🔁 Объединение AI-запросов: {ai_utils.inflight.summary()}\n"
+    message += f"🛡 Пути AI-советов: {ai_utils.served_summary()}\n"
+    message += f"🖼 Картинки в Telegram: {telegram_files.cache.summary()}\n"
+    if spreads.cache is not None:
+        message += f"🔮 Кэш раскладов: {spreads.cache.summary()}\n"
+    message += f"💾 Состояние бота: {persistence.summary()}\n"
+    message += f"🧠 user_data в памяти: {context.application.user_states.summary()}\n"
+    if webhook_server is not None:
+        message += f"🌐 Webhook: {webhook_server.summary()}\n"
+    if update_processor is not None:
+        message += f"⚡ Апдейты: {update_processor.summary()}\n"
+    message += f"🧭 Маршруты:\n{router.summary(limit=5)}\n"
+    message += "\n📋 Подписчики:\n\n"
     for uid, nick, sign, expires in users:
-        message += f"👤 {nick} | ID: {uid}\n♈ Знак: {sign} | до: {expires}\n\n"
+        message += f"👤 {nick} | ID: {uid}\n♈ Знак: {sign} | до: {format_epoch(expires, '%Y-%m-%d')}\n\n"
     await update.message.reply_text(message)
 
+async def warmup_images(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id not in ADMIN_TELEGRAM_IDS:
+        await update.message.reply_text("⛔ Недостаточно прав.")
+        return
+    await update.message.reply_text("⏳ Загружаю картинки карт в Telegram...")
+    image_paths = [
+        card_images.image_path(card.image_file, is_reversed)
+        for card in card_registry.CARDS for is_reversed in (False, True)
+    ]
+    uploaded, known, missing = await telegram_files.warm_up(context.bot, update.message.chat_id, image_paths)
+    await update.message.reply_text(
+        f"✅ Загружено: {uploaded}, уже были: {known}, нет файла: {missing}\n"
+        f"🖼 {telegram_files.cache.summary()}"
+    )
+
+async def evict_idle_users(context: ContextTypes.DEFAULT_TYPE):
+    context.application.user_states.evict()
+
+def register_routes(app):
+    router.command('help', help_command)
+    router.command('history', show_history)
+    router.command('spread', spreads.spread_command)
+    router.command('find', find_command)
+    router.command('subscribe', subscribe)
+    router.command('feedback', feedback)
+    router.command('premium', premium_command)
+    router.command('activate', activate_premium)
+    router.command('adminpanel', admin_panel)
+    router.command('warmup_images', warmup_images)
+    for label, callback in MENU_ROUTES:
+        router.text(label, callback)
+    router.fallback_text(handle_free_text)
+    router.fallback_command(unknown_command)
+    router.install(app)
+
+async def shutdown_storage(app):
+    await close_ai_client()
+    # Фиксируем записи, ещё стоящие в очереди группового коммита
+    await db.stop_writer()
+
 def main():
     try:
-        app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+        builder = (
+            ApplicationBuilder()
+            .application_class(TaroApplication, kwargs={'max_users': USER_STATE_MAX_USERS, 'user_ttl': USER_STATE_TTL})
+            .token(TELEGRAM_BOT_TOKEN)
+            .post_init(resume_daily_cards)
+            .post_shutdown(shutdown_storage)
+            .persistence(persistence)
+        )
+        if update_processor is not None:
+            builder = builder.concurrent_updates(update_processor)
+        app = builder.build()
         logger.info("Бот запущен.")
+        # Карты без картинки уходят без фото, только текстом — запуск из-за них не прерываем
+        card_registry.validate_images(os.path.join(BASE_DIR, 'images'))
 
         conv_handler = ConversationHandler(
             entry_points=[CommandHandler('start', start)],
@@ -274,29 +426,40 @@ def main():
                 ASK_BIRTHDATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_user_profile)],
             },
             fallbacks=[CommandHandler('cancel', cancel)],
+            name='registration',
+            persistent=True,
         )
 
         app.add_handler(conv_handler)
-        app.add_handler(CommandHandler('help', help_command))
-        app.add_handler(CommandHandler('history', show_history))
-        app.add_handler(CommandHandler('subscribe', subscribe))
-        app.add_handler(CommandHandler('feedback', feedback))
-        app.add_handler(CommandHandler('premium', premium_command))
-        app.add_handler(CommandHandler('activate', activate_premium))
-        app.add_handler(CommandHandler('adminpanel', admin_panel))
         app.add_handler(MessageHandler(filters.PHOTO, handle_payment_proof))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        app.add_handler(MessageHandler(filters.COMMAND, unknown_command))
-        app.add_handler(MessageHandler(filters.TEXT & filters.Regex('^🔍 Поиск карты$'), start_card_search))
-        app.add_handler(CallbackQueryHandler(handle_suit_selection, pattern='^suit_'))
-        app.add_handler(CallbackQueryHandler(handle_card_selection, pattern='^card_'))
+        register_routes(app)
+        app.add_handler(CallbackQueryHandler(handle_suit_selection, pattern=SUIT_PATTERN))
+        app.add_handler(CallbackQueryHandler(handle_card_selection, pattern=CARD_PATTERN))
+        # Недостижимые и перекрытые обработчики видно сразу в логе запуска
+        router.check(app)
 
         target_time = time(hour=12, minute=0, tzinfo=pytz.timezone('Europe/Moscow'))
         app.job_queue.run_daily(send_daily_cards, time=target_time)
-
-        app.run_polling()
+        pregen_time = time(hour=PREGEN_HOUR, minute=0, tzinfo=pytz.timezone('Europe/Moscow'))
+        app.job_queue.run_daily(pregenerate_daily_cards, time=pregen_time)
+        # Выгружаем простаивающих пользователей, даже если новых не приходит
+        app.job_queue.run_repeating(evict_idle_users, interval=USER_STATE_TTL / 10, first=USER_STATE_TTL / 10)
+        app.job_queue.run_repeating(retry_failed_deliveries, interval=DELIVERY_RETRY_INTERVAL, first=DELIVERY_RETRY_INTERVAL)
+
+        if UPDATE_MODE == 'webhook':
+            global webhook_server
+            webhook_server = WebhookServer(
+                app, webhook_path(WEBHOOK_URL), os.getenv('WEBHOOK_SECRET') or WEBHOOK_SECRET,
+                workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE, max_connections=WEBHOOK_MAX_CONNECTIONS,
+                idle_timeout=WEBHOOK_IDLE_TIMEOUT,
+            )
+            asyncio.run(run_webhook(app, webhook_server, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT))
+        else:
+            app.run_polling()
     except Exception as e:
         logger.error(f"Ошибка при запуске: {e}")
+    finally:
+        db.close()
 
 if __name__ == '__main__':
     main()
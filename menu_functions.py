@@ -1,70 +1,113 @@
-﻿import os
-import logging
+﻿import logging
 from datetime import datetime
 import random
 import datetime as dt
+from collections import namedtuple
 
 from telegram import Update, ReplyKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
-from cards_data import cards
+import card_registry
 from personal_account import (
     get_zodiac_sign,
-    main_menu_keyboard
+    main_menu_keyboard,
+    personal_account
 )
-from ai_utils import get_ai_description
+from card_search import search_cards, start_card_search, FREE_TEXT_MIN_SCORE
+import subscriptions
+import telegram_files
+import card_images
+from ai_utils import get_ai_description, stream_ai_description
+from config import AI_STREAMING, AI_STREAM_EDIT_INTERVAL
+from db import day_start_epoch, format_epoch
+from live_message import LiveMessage
 
 logger = logging.getLogger(__name__)
 
-conn = None
-cursor = None
+db = None
 BASE_DIR = None
 
-def initialize_menu_functions(connection, db_cursor, base_directory):
-    global conn, cursor, BASE_DIR
-    conn = connection
-    cursor = db_cursor
+def initialize_menu_functions(database, base_directory):
+    global db, BASE_DIR
+    db = database
     BASE_DIR = base_directory
 
-async def daily_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global conn, cursor, BASE_DIR
-    user = update.message.from_user
-    logger.info(f"Пользователь {user.username} ({user.id}) запросил карту дня.")
-
-    now = dt.datetime.now()
-    today_str = now.strftime('%Y-%m-%d')
-    last_draw_date_str = context.user_data.get('daily_card_date')
+# Результат вытягивания карты дня: всё, что нужно для отправки
+DailyDraw = namedtuple('DailyDraw', 'card is_reversed caption image_path drawn_at')
 
-    if last_draw_date_str == today_str:
-        await update.message.reply_text("Вы уже получали карту на сегодня. Возвращайтесь завтра!")
-        return
-
-    cursor.execute(
+async def _load_profile(user_id, first_name=''):
+    user_data = await db.fetchone(
         "SELECT nickname, zodiac_sign, total_cards, straight_cards, reversed_cards, consecutive_days, last_card_date "
         "FROM users WHERE user_id = ?",
-        (user.id,)
+        (user_id,)
     )
-    user_data = cursor.fetchone()
     if user_data:
-        nickname, zodiac_sign, total_cards, straight_cards, reversed_cards, consecutive_days, last_card_date = user_data
+        return user_data
+    # nickname, zodiac_sign, total_cards, straight_cards, reversed_cards, consecutive_days, last_card_date
+    return first_name, None, 0, 0, 0, 0, None
+
+def _pick_card():
+    return card_registry.random_card().name, random.choice([True, False])
+
+def _premium_caption_parts(nickname, card, is_reversed):
+    """
+    Начало и конец подписи премиум-карты; AI-совет вставляется между ними.
+    """
+    position = "Перевёрнутая" if is_reversed else "Прямая"
+    return (
+        f"🃏 {nickname}, ваша карта дня: {card} ({position})\n\n🤖 *AI-совет:*\n",
+        "\n\n✨ Получено по премиум-доступу"
+    )
+
+def _ai_fallback_text(entry):
+    return f"⚠️ Не удалось получить совет от AI.\n\n💡 Совет по карте: {entry.advice}"
+
+async def compose_daily_card(user_id, nickname, zodiac_sign):
+    """
+    Выбирает карту и готовит подпись (с AI-советом для премиума), ничего не записывая.
+    Возвращает (card, is_reversed, caption, ai_failed).
+    """
+    card, is_reversed = _pick_card()
+    entry = card_registry.BY_NAME[card]
+
+    position = "Перевёрнутая" if is_reversed else "Прямая"
+    description = entry.meaning(is_reversed)
+    advice = entry.advice
+
+    # Проверка подписки
+    is_premium = await subscriptions.is_premium(user_id)
+
+    # Генерация AI-совета или fallback
+    ai_failed = False
+    if is_premium:
+        try:
+            ai_text = await get_ai_description(card, entry.info, zodiac_sign, is_reversed)
+        except Exception as e:
+            logger.error(f"Ошибка при генерации AI-совета: {e}")
+            ai_failed = True
+            ai_text = _ai_fallback_text(entry)
+        head, tail = _premium_caption_parts(nickname, card, is_reversed)
+        caption = head + ai_text + tail
     else:
-        nickname = user.first_name
-        zodiac_sign = None
-        total_cards = 0
-        straight_cards = 0
-        reversed_cards = 0
-        consecutive_days = 0
-        last_card_date = None
-
-    card = random.choice(list(cards.keys()))
-    card_info = cards[card]
-    is_reversed = random.choice([True, False])
-    image_path = os.path.join(BASE_DIR, 'images', card_info['image_file'])
+        caption = (
+            f"🃏 {nickname}, ваша карта дня: {card} ({position})\n\n"
+            f"💬 *Значение:*\n{description}\n\n"
+            f"💡 *Совет:*\n{advice}\n\n"
+            f"🔒 Получите персональный AI-совет, оформив премиум-подписку."
+        )
+    return card, is_reversed, caption, ai_failed
+
+async def _record_draw(user_id, profile, card, is_reversed, now, extra_statements=()):
+    _, _, total_cards, straight_cards, reversed_cards, consecutive_days, last_card_date = profile
 
     if last_card_date:
         last_date = datetime.strptime(last_card_date, '%Y-%m-%d')
         delta = now.date() - last_date.date()
-        if delta.days == 1:
+        if delta.days == 0:
+            # Вторая карта за тот же день серию не меняет
+            consecutive_days = max(consecutive_days, 1)
+        elif delta.days == 1:
             consecutive_days += 1
         else:
             consecutive_days = 1
@@ -78,64 +121,203 @@ async def daily_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
         straight_cards += 1
 
     last_card_date_str = now.strftime('%Y-%m-%d')
-    cursor.execute(
-        "UPDATE users SET total_cards = ?, straight_cards = ?, reversed_cards = ?, consecutive_days = ?, last_card_date = ? "
-        "WHERE user_id = ?",
-        (total_cards, straight_cards, reversed_cards, consecutive_days, last_card_date_str, user.id)
-    )
-    conn.commit()
 
-    position = "Перевёрнутая" if is_reversed else "Прямая"
-    description = card_info.get('reversed_description') if is_reversed else card_info.get('description')
-    advice = card_info.get('advice', '')
+    # Статистика и история фиксируются одной транзакцией
+    try:
+        await db.transaction([
+            ("UPDATE users SET total_cards = ?, straight_cards = ?, reversed_cards = ?, consecutive_days = ?, last_card_date = ? "
+             "WHERE user_id = ?",
+             (total_cards, straight_cards, reversed_cards, consecutive_days, last_card_date_str, user_id)),
+            ("INSERT INTO history (user_id, date, card, is_reversed, type) VALUES (?, ?, ?, ?, ?)",
+             (user_id, int(now.timestamp()), card, int(is_reversed), 'daily_card')),
+            *extra_statements,
+        ])
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении истории: {e}")
 
-    # Проверка подписки
-    cursor.execute("SELECT 1 FROM subscriptions WHERE user_id = ?", (user.id,))
-    is_premium = cursor.fetchone() is not None
+async def draw_daily_card(user_id, first_name='', use_staged=False):
+    """
+    Вытягивает карту дня: выбирает карту, готовит подпись, обновляет статистику и историю.
+    С use_staged=True берёт карту, заранее подготовленную stage_daily_card, если она есть.
+    Ничего не отправляет — это делает send_daily_card.
+    """
+    now = dt.datetime.now()
+    profile = await _load_profile(user_id, first_name)
+    card, is_reversed, caption = await _choose_daily_card(user_id, profile, now, use_staged)
+    await _record_draw(user_id, profile, card, is_reversed, now)
+    return _daily_draw(card, is_reversed, caption, now)
 
-    # Генерация AI-совета или fallback
-    if is_premium:
-        try:
-            ai_text = await get_ai_description(card, card_info, zodiac_sign, is_reversed)
-        except Exception as e:
-            logger.error(f"Ошибка при генерации AI-совета: {e}")
-            ai_text = f"⚠️ Не удалось получить совет от AI.\n\n💡 Совет по карте: {advice}"
-        caption = (
-            f"🃏 {nickname}, ваша карта дня: {card} ({position})\n\n"
-            f"🤖 *AI-совет:*\n{ai_text}\n\n"
-            f"✨ Получено по премиум-доступу"
-        )
-    else:
-        caption = (
-            f"🃏 {nickname}, ваша карта дня: {card} ({position})\n\n"
-            f"💬 *Значение:*\n{description}\n\n"
-            f"💡 *Совет:*\n{advice}\n\n"
-            f"🔒 Получите персональный AI-совет, оформив премиум-подписку."
+async def _choose_daily_card(user_id, profile, now, use_staged):
+    staged = None
+    if use_staged:
+        staged = await db.fetchone(
+            "SELECT card, is_reversed, caption FROM staged_draws WHERE user_id = ? AND day = ?",
+            (user_id, day_start_epoch(now.date()))
         )
+    if staged and staged[0] in card_registry.BY_NAME:
+        return staged[0], bool(staged[1]), staged[2]
+    card, is_reversed, caption, _ = await compose_daily_card(user_id, profile[0], profile[1])
+    return card, is_reversed, caption
+
+def _daily_draw(card, is_reversed, caption, drawn_at):
+    image_path = card_images.image_path(card_registry.BY_NAME[card].image_file, is_reversed)
+    return DailyDraw(card, is_reversed, caption, image_path, drawn_at)
+
+async def stage_daily_card(user_id):
+    """
+    Готовит карту дня заранее (в ночное окно): вытягивает карту, получает AI-совет
+    и сохраняет готовую подпись в staged_draws. В полдень рассылке остаётся только отправить.
+    Если AI не ответил, карта не сохраняется и будет вытянута при рассылке.
+    Возвращает False, если карта на сегодня уже подготовлена.
+    """
+    day = day_start_epoch(dt.date.today())
+    if await db.fetchone("SELECT 1 FROM staged_draws WHERE user_id = ? AND day = ?", (user_id, day)):
+        return False
+    nickname, zodiac_sign = (await _load_profile(user_id))[:2]
+    card, is_reversed, caption, ai_failed = await compose_daily_card(user_id, nickname, zodiac_sign)
+    if ai_failed:
+        raise RuntimeError("AI-совет не получен, карта будет вытянута при рассылке")
+    await db.execute(
+        "INSERT OR REPLACE INTO staged_draws (user_id, day, card, is_reversed, caption, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, day, card, int(is_reversed), caption, int(dt.datetime.now().timestamp()))
+    )
+    return True
+
+async def send_card_photo(bot, chat_id, image_path):
+    # По file_id, если картинка уже загружалась; файла нет — просто без картинки
+    await telegram_files.send_photo(bot, chat_id, image_path)
 
-    context.user_data['daily_card_date'] = today_str
-    context.user_data['daily_card'] = {
+async def send_daily_card(bot, chat_id, draw):
+    # Отправка изображения и текста
+    await send_card_photo(bot, chat_id, draw.image_path)
+    await bot.send_message(chat_id=chat_id, text=draw.caption, parse_mode='Markdown')
+
+async def stream_daily_card(bot, chat_id, user_id, first_name=''):
+    """
+    Карта дня для премиума с потоковым AI-советом: картинка уходит сразу,
+    затем сообщение-заготовка дописывается по мере генерации совета.
+    Возвращает DailyDraw с итоговой подписью.
+    """
+    now = dt.datetime.now()
+    profile = await _load_profile(user_id, first_name)
+    nickname, zodiac_sign = profile[:2]
+    card, is_reversed = _pick_card()
+    entry = card_registry.BY_NAME[card]
+    await _record_draw(user_id, profile, card, is_reversed, now)
+
+    image_path = card_images.image_path(entry.image_file, is_reversed)
+    await send_card_photo(bot, chat_id, image_path)
+
+    head, tail = _premium_caption_parts(nickname, card, is_reversed)
+    message = LiveMessage(bot, chat_id, min_interval=AI_STREAM_EDIT_INTERVAL)
+    await message.start(head)
+    ai_parts = []
+    try:
+        async for chunk in stream_ai_description(card, entry.info, zodiac_sign, is_reversed):
+            if not ai_parts:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+            ai_parts.append(chunk)
+            await message.append(chunk)
+    except TelegramError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при генерации AI-совета: {e}")
+        fallback = ("\n\n" if ai_parts else "") + _ai_fallback_text(entry)
+        ai_parts.append(fallback)
+        await message.append(fallback)
+    await message.finish(tail)
+
+    return DailyDraw(card, is_reversed, head + ''.join(ai_parts) + tail, image_path, now)
+
+def remember_daily_card(user_data, card, is_reversed, drawn_at):
+    user_data['daily_card_date'] = drawn_at.strftime('%Y-%m-%d')
+    user_data['daily_card'] = {
         'card': card,
-        'date': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'date': drawn_at.strftime('%Y-%m-%d %H:%M:%S'),
         'is_reversed': is_reversed
     }
 
+async def todays_daily_card(user_id):
+    """
+    Карта дня, уже вытянутая сегодня (вручную или рассылкой), по истории: (card, is_reversed, drawn_at) или None.
+    """
+    row = await db.fetchone(
+        "SELECT card, is_reversed, date FROM history WHERE user_id = ? AND type = 'daily_card' AND date >= ? "
+        "ORDER BY date DESC LIMIT 1",
+        (user_id, day_start_epoch(dt.date.today()))
+    )
+    if row is None:
+        return None
+    return row[0], bool(row[1]), dt.datetime.fromtimestamp(row[2])
+
+async def deliver_daily_card(bot, user_id, delivery=None, application=None):
+    """
+    Вытягивает и отправляет карту дня без Update — для ежедневной рассылки.
+    Тем, кто уже вытянул карту сегодня, ничего не шлёт и возвращает False.
+    С delivery (запись журнала рассылки) вытянутая карта сохраняется в журнал той же транзакцией,
+    что и статистика; повторная попытка отправляет ту же карту, не записывая её заново,
+    и не шлёт повторно уже дошедшую картинку.
+    С application карта запоминается в user_data пользователя, если он сейчас в памяти.
+    """
+    saved = delivery.payload if delivery is not None else {}
+    if 'card' in saved:
+        draw = _daily_draw(saved['card'], saved['is_reversed'], saved['caption'],
+                           dt.datetime.fromtimestamp(saved['drawn_at']))
+    else:
+        profile = await _load_profile(user_id)
+        if profile[6] == dt.date.today().strftime('%Y-%m-%d'):
+            return False
+        now = dt.datetime.now()
+        card, is_reversed, caption = await _choose_daily_card(user_id, profile, now, use_staged=True)
+        draw = _daily_draw(card, is_reversed, caption, now)
+        statements = []
+        if delivery is not None:
+            statements.append(delivery.save_statement(
+                card=card, is_reversed=is_reversed, caption=caption, drawn_at=int(now.timestamp())
+            ))
+        await _record_draw(user_id, profile, card, is_reversed, now, statements)
+
+    if not saved.get('photo_sent'):
+        await send_card_photo(bot, user_id, draw.image_path)
     try:
-        cursor.execute(
-            "INSERT INTO history (user_id, date, card, is_reversed, type) VALUES (?, ?, ?, ?, ?)",
-            (user.id, now.strftime('%Y-%m-%d %H:%M:%S'), card, int(is_reversed), 'daily_card')
-        )
-        conn.commit()
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении истории: {e}")
+        await bot.send_message(chat_id=user_id, text=draw.caption, parse_mode='Markdown')
+    except Exception:
+        if delivery is not None:
+            await delivery.save(photo_sent=True)
+        raise
+    if application is not None and user_id in application.user_data:
+        remember_daily_card(application.user_data[user_id], draw.card, draw.is_reversed, draw.drawn_at)
+        application.mark_data_for_update_persistence(user_ids=user_id)
+    return draw
 
-    # Отправка изображения и текста
-    if os.path.exists(image_path):
-        with open(image_path, 'rb') as photo:
-            await update.message.reply_photo(photo=photo)
-        await update.message.reply_text(caption, parse_mode='Markdown')
+async def daily_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.message.from_user
+    logger.info(f"Пользователь {user.username} ({user.id}) запросил карту дня.")
+
+    today_str = dt.datetime.now().strftime('%Y-%m-%d')
+    last_draw_date_str = context.user_data.get('daily_card_date')
+
+    if last_draw_date_str != today_str:
+        # Карту могла принести рассылка, пока пользователя не было в памяти
+        drawn = await todays_daily_card(user.id)
+        if drawn:
+            remember_daily_card(context.user_data, *drawn)
+            last_draw_date_str = today_str
+
+    if last_draw_date_str == today_str:
+        await update.message.reply_text("Вы уже получали карту на сегодня. Возвращайтесь завтра!")
+        return
+
+    if AI_STREAMING and await subscriptions.is_premium(user.id):
+        draw = await stream_daily_card(context.bot, update.message.chat_id, user.id, user.first_name)
     else:
-        await update.message.reply_text(caption, parse_mode='Markdown')
+        draw = await draw_daily_card(user.id, user.first_name)
+        await send_daily_card(context.bot, update.message.chat_id, draw)
+
+    remember_daily_card(context.user_data, draw.card, draw.is_reversed, draw.drawn_at)
 
 
 async def send_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -150,17 +332,17 @@ async def send_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     try:
-        cursor.execute(
+        rows = await db.fetchall(
             "SELECT date, card, is_reversed FROM history WHERE user_id = ? ORDER BY date DESC LIMIT 30",
             (user.id,)
         )
-        rows = cursor.fetchall()
         if rows:
             text = "📜 Ваша история карт:\n\n"
-            for date_str, card_name, is_rev in rows:
+            for drawn_at, card_name, is_rev in rows:
                 pos = "Перевёрнутая" if is_rev else "Прямая"
-                advice = cards.get(card_name, {}).get('advice', '')
-                text += f"{date_str} | {card_name} ({pos}) | {advice}\n"
+                entry = card_registry.get(card_name)
+                advice = entry.advice if entry else ''
+                text += f"{format_epoch(drawn_at)} | {card_name} ({pos}) | {advice}\n"
             await update.message.reply_text(text)
         else:
             await update.message.reply_text("У вас пока нет истории карт.")
@@ -171,8 +353,8 @@ async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     try:
-        cursor.execute("INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)", (user.id,))
-        conn.commit()
+        await db.execute("INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)", (user.id,))
+        subscriptions.cache.invalidate(user.id)
         await update.message.reply_text("✅ Вы подписались на ежедневные уведомления.")
     except Exception as e:
         logger.error(f"Ошибка при подписке: {e}")
@@ -184,6 +366,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/start – Начать\n"
         "/help – Помощь\n"
         "/history – История карт\n"
+        "/spread – Расклад из трёх карт (/spread celtic – кельтский крест)\n"
+        "/find – Найти карту по названию или слову (можно просто написать его)\n"
         "/subscribe – Подписка\n"
         "/feedback – Отзыв\n"
         "/premium – Оформить премиум\n"
@@ -200,7 +384,7 @@ async def settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("⚙️ Настройки:", reply_markup=settings_menu_keyboard())
 
 async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Главное меню:", reply_markup=main_menu_keyboard())
+    await update.message.reply_text("Главное меню:", reply_markup=await main_menu_keyboard(update.message.from_user.id))
 
 async def request_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("✉️ Пожалуйста, отправьте отзыв командой:\n/feedback [текст]")
@@ -216,31 +400,25 @@ async def premium_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(message, parse_mode='Markdown')
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
-    if text == '🃏 Карта дня':
-        await daily_card(update, context)
-    elif text == '📜 История':
-        await show_history(update, context)
-    elif text == '📰 Новости':
-        await send_news(update, context)
-    elif text == '⚙️ Настройки':
-        await settings_menu(update, context)
-    elif text == '⬅️ Назад':
-        await main_menu(update, context)
-    elif text == '🔔 Подписаться':
-        await subscribe(update, context)
-    elif text == '❓ Помощь':
-        await help_command(update, context)
-    elif text == '✉️ Отзыв':
-        await request_feedback(update, context)
-    elif text == '👤 Личный кабинет':
-        from personal_account import personal_account
-        await personal_account(update, context)
-    elif text == '🔍 Поиск карты':
-        from card_search import start_card_search
-        await start_card_search(update, context)
-    elif text == '💎 Премиум-доступ':
-        await premium_command(update, context)
-    else:
-        await update.message.reply_text("🤖 Я не понял команду. Используйте меню.", reply_markup=main_menu_keyboard())
+async def handle_free_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Текст, не совпавший ни с одной кнопкой: если в нём есть название карты (можно с опечаткой), предлагаем её.
+    """
+    if await search_cards(update, context, update.message.text, min_score=FREE_TEXT_MIN_SCORE, whole_name=True):
+        return
+    await update.message.reply_text("🤖 Я не понял команду. Используйте меню.", reply_markup=await main_menu_keyboard(update.message.from_user.id))
+
+# Кнопки меню: надпись -> обработчик (маршруты собирает router.Router в main.py)
+MENU_ROUTES = (
+    ('🃏 Карта дня', daily_card),
+    ('📜 История', show_history),
+    ('📰 Новости', send_news),
+    ('⚙️ Настройки', settings_menu),
+    ('⬅️ Назад', main_menu),
+    ('🔔 Подписаться', subscribe),
+    ('❓ Помощь', help_command),
+    ('✉️ Отзыв', request_feedback),
+    ('👤 Личный кабинет', personal_account),
+    ('🔍 Поиск карты', start_card_search),
+    ('💎 Премиум-доступ', premium_command),
+)
@@ -0,0 +1,298 @@
+import logging
+import time
+
+from db import to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Список миграций по порядку: (версия, название, функция(cursor)).
+# Применённые версии записываются в schema_migrations; новые миграции добавляются только в конец.
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def decorator(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return decorator
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+@migration(1, 'Исходная схема')
+def baseline(cursor):
+    # Таблицы, которые раньше создавались при импорте main.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history (
+            user_id INTEGER,
+            date TEXT,
+            card TEXT,
+            is_reversed INTEGER,
+            type TEXT DEFAULT 'daily_card'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            user_id INTEGER PRIMARY KEY,
+            expires_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            nickname TEXT,
+            birth_date TEXT,
+            zodiac_sign TEXT,
+            avatar TEXT,
+            total_cards INTEGER DEFAULT 0,
+            straight_cards INTEGER DEFAULT 0,
+            reversed_cards INTEGER DEFAULT 0,
+            consecutive_days INTEGER DEFAULT 0,
+            last_card_date TEXT,
+            achievements TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS achievements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            description TEXT,
+            condition TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id INTEGER,
+            achievement_id INTEGER,
+            date_achieved TEXT,
+            PRIMARY KEY (user_id, achievement_id)
+        )
+    ''')
+    # Старые базы могли быть созданы без этих колонок
+    if 'expires_at' not in _columns(cursor, 'subscriptions'):
+        cursor.execute("ALTER TABLE subscriptions ADD COLUMN expires_at TEXT")
+    if 'achievements' not in _columns(cursor, 'users'):
+        cursor.execute("ALTER TABLE users ADD COLUMN achievements TEXT")
+
+
+@migration(2, 'history: первичный ключ, дата в epoch, покрывающий индекс')
+def history_epoch_and_index(cursor):
+    cursor.execute('''
+        CREATE TABLE history_new (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date INTEGER NOT NULL,
+            card TEXT NOT NULL,
+            is_reversed INTEGER NOT NULL DEFAULT 0,
+            type TEXT DEFAULT 'daily_card'
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO history_new (user_id, date, card, is_reversed, type)
+        SELECT user_id, COALESCE(to_epoch(date), 0), card, COALESCE(is_reversed, 0), type
+        FROM history
+        WHERE user_id IS NOT NULL AND card IS NOT NULL
+        ORDER BY rowid
+    ''')
+    cursor.execute("DROP TABLE history")
+    cursor.execute("ALTER TABLE history_new RENAME TO history")
+    # show_history читает только из индекса: WHERE user_id = ? ORDER BY date DESC LIMIT 30
+    cursor.execute(
+        "CREATE INDEX idx_history_user_date ON history (user_id, date DESC, card, is_reversed)"
+    )
+
+
+@migration(3, 'subscriptions: expires_at в epoch и индекс по сроку')
+def subscriptions_epoch_and_index(cursor):
+    cursor.execute('''
+        CREATE TABLE subscriptions_new (
+            user_id INTEGER PRIMARY KEY,
+            expires_at INTEGER
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO subscriptions_new (user_id, expires_at)
+        SELECT user_id, to_epoch(expires_at) FROM subscriptions
+    ''')
+    cursor.execute("DROP TABLE subscriptions")
+    cursor.execute("ALTER TABLE subscriptions_new RENAME TO subscriptions")
+    cursor.execute("CREATE INDEX idx_subscriptions_expires_at ON subscriptions (expires_at)")
+
+
+@migration(4, 'achievements: уникальные названия, date_achieved в epoch')
+def achievements_cleanup(cursor):
+    # Старый код заводил набор достижений при каждом запуске — оставляем по одному на название
+    cursor.execute('''
+        CREATE TEMP TABLE achievement_ids AS
+        SELECT a.id AS old_id, k.keep_id AS new_id
+        FROM achievements a
+        JOIN (SELECT name, MIN(id) AS keep_id FROM achievements GROUP BY name) k ON a.name IS k.name
+    ''')
+    cursor.execute('''
+        CREATE TABLE user_achievements_new (
+            user_id INTEGER NOT NULL,
+            achievement_id INTEGER NOT NULL,
+            date_achieved INTEGER,
+            PRIMARY KEY (user_id, achievement_id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO user_achievements_new (user_id, achievement_id, date_achieved)
+        SELECT ua.user_id, COALESCE(m.new_id, ua.achievement_id), to_epoch(ua.date_achieved)
+        FROM user_achievements ua
+        LEFT JOIN achievement_ids m ON m.old_id = ua.achievement_id
+        WHERE ua.user_id IS NOT NULL AND ua.achievement_id IS NOT NULL
+        ORDER BY ua.date_achieved
+    ''')
+    cursor.execute("DROP TABLE user_achievements")
+    cursor.execute("ALTER TABLE user_achievements_new RENAME TO user_achievements")
+    cursor.execute("DELETE FROM achievements WHERE id NOT IN (SELECT new_id FROM achievement_ids)")
+    cursor.execute("DROP TABLE achievement_ids")
+    cursor.execute("CREATE UNIQUE INDEX idx_achievements_name ON achievements (name)")
+    cursor.execute(
+        "CREATE INDEX idx_user_achievements_achievement ON user_achievements (achievement_id)"
+    )
+
+
+@migration(5, 'deliveries: журнал доставки ежедневной рассылки')
+def deliveries_ledger(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deliveries (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER,
+            last_error TEXT,
+            updated_at INTEGER,
+            PRIMARY KEY (user_id, day)
+        )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_deliveries_day_state ON deliveries (day, state, user_id)"
+    )
+
+
+@migration(6, 'staged_draws: заранее подготовленные карты дня')
+def staged_draws(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staged_draws (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            card TEXT NOT NULL,
+            is_reversed INTEGER NOT NULL,
+            caption TEXT NOT NULL,
+            created_at INTEGER,
+            PRIMARY KEY (user_id, day)
+        )
+    ''')
+
+
+@migration(7, 'ai_advice_cache: сохранённые AI-советы')
+def ai_advice_cache(cursor):
+    # zodiac_sign = '' для пользователей без знака
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_advice_cache (
+            card TEXT NOT NULL,
+            is_reversed INTEGER NOT NULL,
+            zodiac_sign TEXT NOT NULL,
+            variant INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (card, is_reversed, zodiac_sign, variant)
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(8, 'telegram_files: file_id загруженных в Telegram картинок')
+def telegram_files(cursor):
+    # path — путь относительно каталога бота; size и mtime — чтобы заметить замену файла
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_files (
+            path TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            uploaded_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(9, 'bot_user_data, bot_chat_data, bot_conversations: состояние бота между перезапусками')
+def bot_persistence(cursor):
+    # data — JSON из context.user_data / chat_data; key диалога — JSON-список (chat_id, user_id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_chat_data (
+            chat_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(10, 'deliveries: payload — что уже сделано для доставки')
+def deliveries_payload(cursor):
+    # JSON: вытянутая карта с подписью и отправлена ли картинка — повтор продолжает с этого места
+    if 'payload' not in _columns(cursor, 'deliveries'):
+        cursor.execute("ALTER TABLE deliveries ADD COLUMN payload TEXT")
+
+
+def run_migrations(conn):
+    """
+    Применяет ещё не применённые миграции, каждую в своей транзакции.
+    Возвращает список применённых версий.
+    """
+    conn.create_function('to_epoch', 1, to_epoch, deterministic=True)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at INTEGER
+            )
+        ''')
+        conn.commit()
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        done = []
+        for version, name, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in applied:
+                continue
+            logger.info(f"Применяется миграция {version}: {name}")
+            cursor.execute("BEGIN")
+            try:
+                func(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, int(time.time()))
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Миграция {version} не применена, изменения откатены.")
+                raise
+            done.append(version)
+        return done
+    finally:
+        cursor.close()
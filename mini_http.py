@@ -0,0 +1,162 @@
+"""
+Минимальный HTTP/1.1 на asyncio-потоках — для локальных стендов и бенчмарков без внешних зависимостей.
+"""
+import asyncio
+import json
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    408: 'Request Timeout',
+    413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HTTPError(ValueError):
+    """
+    Запрос нельзя разобрать; status — код ответа клиенту.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    __slots__ = ('method', 'path', 'headers', 'body')
+
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b'{}')
+
+    @property
+    def keep_alive(self):
+        return self.headers.get('connection', '').lower() != 'close'
+
+
+async def read_request(reader: asyncio.StreamReader, max_body: int = 1 << 20, timeout=None):
+    """
+    Читает один запрос. Возвращает Request или None, если клиент закрыл соединение (в том числе
+    посреди запроса) или за timeout секунд не прислал заголовки.
+    Неразборчивый запрос — HTTPError с кодом 400, 413 или 431, тело, не дочитанное за timeout, — 408.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "Заголовки запроса слишком длинные") from None
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, f"Неверная строка запроса: {lines[0][:100]!r}") from None
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, f"Неверный Content-Length: {headers['content-length'][:100]!r}")
+    if length > max_body:
+        raise HTTPError(413, f"Тело запроса слишком большое: {length} байт")
+    try:
+        body = await asyncio.wait_for(reader.readexactly(length), timeout) if length else b''
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.TimeoutError:
+        raise HTTPError(408, f"Тело запроса не пришло за {timeout:g} с") from None
+    return Request(method, path, headers, body)
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, body=b'', content_type='application/json',
+                   headers=None, keep_alive=True):
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+    lines = [
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+
+def write_chunk_headers(writer: asyncio.StreamWriter, status: int = 200, content_type='text/event-stream'):
+    """
+    Заголовки ответа с Transfer-Encoding: chunked (для потоковой отдачи).
+    """
+    writer.write((
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        "Transfer-Encoding: chunked\r\n"
+        "Connection: keep-alive\r\n\r\n"
+    ).encode('latin-1'))
+
+
+def write_chunk(writer: asyncio.StreamWriter, data: bytes):
+    writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+
+
+def serve(handler, host='127.0.0.1', port=0, max_connections=None, idle_timeout=60.0, **kwargs):
+    """
+    Возвращает корутину asyncio.start_server, которая вызывает
+    await handler(request, writer) для каждого запроса на соединении (keep-alive поддерживается).
+    Обработчик сам пишет ответ через write_response.
+    max_connections ограничивает число одновременно открытых соединений: лишние не ждут
+    очереди, а сразу получают 503 и закрываются. Соединение, по которому idle_timeout секунд
+    не приходит запрос (или не дочитывается его тело), закрывается.
+    """
+    active = 0
+
+    async def on_connection(reader, writer):
+        nonlocal active
+        if max_connections and active >= max_connections:
+            write_response(writer, 503, {'error': "Слишком много соединений"}, keep_alive=False)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+            return
+        active += 1
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, timeout=idle_timeout)
+                except HTTPError as e:
+                    write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                await handler(request, writer)
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            active -= 1
+            writer.close()
+
+    return asyncio.start_server(on_connection, host, port, **kwargs)
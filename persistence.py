@@ -0,0 +1,239 @@
+"""
+Хранение состояния бота (context.user_data и состояний ConversationHandler) в user_data.db,
+чтобы перезапуск не сбрасывал карту дня и недописанную регистрацию. chat_data бот не использует
+и не сохраняет (иначе Application заводил бы в памяти пустой словарь на каждый чат),
+таблица bot_chat_data оставлена на случай, если понадобится.
+
+Application раз в update_interval секунд передаёт сюда данные пользователей,
+затронутых с прошлого раза. Здесь они только помечаются грязными (если изменились с последней
+записи), а записываются все вместе одной транзакцией. При остановке бота flush()
+дописывает остаток.
+
+user_data читается лениво: при первом апдейте пользователя (refresh_user_data),
+а не все сразу при запуске, и заново — после вытеснения из памяти (user_state.py).
+Состояния диалогов ConversationHandler читает сам на старте.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед записью: за неё Application успевает передать все изменения своего прохода
+FLUSH_DELAY = 0.1
+# После неудачной записи повторяем через FLUSH_RETRY_DELAY, удваивая паузу до FLUSH_RETRY_MAX_DELAY
+FLUSH_RETRY_DELAY = 1.0
+FLUSH_RETRY_MAX_DELAY = 60.0
+
+_TABLES = {
+    'user': ('bot_user_data', 'user_id'),
+    'chat': ('bot_chat_data', 'chat_id'),
+}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, db, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self._loaded = set()  # (вид, id), чьи данные уже в памяти
+        # (вид, id) -> JSON, записанный в базу последним (None — записи нет); только для данных в памяти
+        self._written = {}
+        self._dirty = {}  # (вид, id) -> JSON или None (удалить)
+        self._writing = {}  # то же, но уже в транзакции, которая ещё не зафиксирована
+        self._dirty_conversations = {}  # (name, key) -> JSON состояния или None (удалить)
+        self._flush_task = None
+        self.loaded = 0
+        self.evicted = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.skipped_unchanged = 0
+
+    # --- Ленивое чтение ---
+
+    async def _refresh(self, kind, object_id, data):
+        item = (kind, object_id)
+        if item in self._loaded:
+            return
+        # Данные, вытесненные из памяти, но ещё не записанные, берём из очереди записи
+        if item in self._dirty or item in self._writing:
+            payload = self._dirty[item] if item in self._dirty else self._writing[item]
+        else:
+            table, column = _TABLES[kind]
+            row = await self.db.fetchone(f"SELECT data FROM {table} WHERE {column} = ?", (object_id,))
+            # Пока шёл запрос, другой апдейт того же чата мог прочитать его раньше
+            if item in self._loaded:
+                return
+            payload = row[0] if row else None
+            self._written[item] = payload
+        self._loaded.add(item)
+        if payload:
+            self.loaded += 1
+            for key, value in json.loads(payload).items():
+                # В памяти могли появиться свежие значения — их не перетираем
+                data.setdefault(key, value)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh('user', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh('chat', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await self.db.fetchall("SELECT key, state FROM bot_conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    # --- Пометка изменений ---
+
+    def _mark(self, kind, object_id, data):
+        if data is None:
+            payload = None
+        else:
+            try:
+                payload = _dumps(data)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Не удалось сохранить {kind}_data {object_id}: {e}")
+                return
+        item = (kind, object_id)
+        if item in self._written and self._written[item] == payload and item not in self._dirty:
+            self.skipped_unchanged += 1
+            return
+        self._dirty[item] = payload
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id, data):
+        self._mark('user', user_id, dict(data) or None)
+
+    async def update_chat_data(self, chat_id, data):
+        self._mark('chat', chat_id, dict(data) or None)
+
+    async def drop_user_data(self, user_id):
+        self._mark('user', user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._mark('chat', chat_id, None)
+
+    def evict_user(self, user_id, data):
+        """
+        Пользователь вытеснен из памяти: его данные уходят в очередь записи,
+        а при следующем апдейте будут прочитаны заново (refresh_user_data).
+        """
+        self._mark('user', user_id, dict(data) or None)
+        self._loaded.discard(('user', user_id))
+        self._written.pop(('user', user_id), None)
+        self.evicted += 1
+
+    async def update_conversation(self, name, key, new_state):
+        self._dirty_conversations[(name, _dumps(list(key)))] = None if new_state is None else _dumps(new_state)
+        self._schedule_flush()
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    # --- Запись ---
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # Пока задача жива, новых не заводим: всё, что пометили во время записи
+        # или вернули после неудачной, записывается следующим кругом
+        delay = FLUSH_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._write()
+            except Exception as e:
+                delay = min(delay * 2, FLUSH_RETRY_MAX_DELAY) if delay >= FLUSH_RETRY_DELAY else FLUSH_RETRY_DELAY
+                logger.error(f"Не удалось сохранить состояние бота: {e}. Повтор через {delay:g} с.")
+            else:
+                delay = FLUSH_DELAY
+            if not self._dirty and not self._dirty_conversations:
+                return
+
+    async def _write(self):
+        dirty, self._dirty = self._dirty, {}
+        conversations, self._dirty_conversations = self._dirty_conversations, {}
+        if not dirty and not conversations:
+            return
+        now = int(time.time())
+        statements = []
+        for (kind, object_id), payload in dirty.items():
+            table, column = _TABLES[kind]
+            if payload is None:
+                statements.append((f"DELETE FROM {table} WHERE {column} = ?", (object_id,)))
+            else:
+                statements.append((
+                    f"INSERT INTO {table} ({column}, data, updated_at) VALUES (?, ?, ?) "
+                    f"ON CONFLICT({column}) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    (object_id, payload, now)
+                ))
+        for (name, key), state in conversations.items():
+            if state is None:
+                statements.append(("DELETE FROM bot_conversations WHERE name = ? AND key = ?", (name, key)))
+            else:
+                statements.append((
+                    "INSERT OR REPLACE INTO bot_conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)",
+                    (name, key, state, now)
+                ))
+        self._writing = dirty
+        try:
+            await self.db.transaction(statements)
+        except BaseException:
+            # Вернём несохранённое (и при отмене тоже), если за это время не пришло что-то новее
+            for item, payload in dirty.items():
+                self._dirty.setdefault(item, payload)
+            for item, state in conversations.items():
+                self._dirty_conversations.setdefault(item, state)
+            raise
+        finally:
+            self._writing = {}
+        for item, payload in dirty.items():
+            if item in self._loaded:
+                self._written[item] = payload
+        self.flushes += 1
+        self.rows_written += len(statements)
+
+    async def flush(self):
+        """
+        Вызывается Application при остановке: дописывает всё несохранённое.
+        Отложенная запись отменяется (она может ждать повтора после ошибки) — её данные пишутся здесь.
+        """
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.wait([self._flush_task])
+        await self._write()
+
+    def summary(self):
+        return (
+            f"прочитано {self.loaded}, вытеснено из памяти {self.evicted}, записей {self.flushes} (строк {self.rows_written}), "
+            f"без изменений пропущено {self.skipped_unchanged}, ждут записи {len(self._dirty) + len(self._dirty_conversations)}"
+        )
@@ -3,70 +3,78 @@ from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
 
+import subscriptions
+from db import format_epoch
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Глобальные переменные для подключения к базе данных
-conn = None
-cursor = None
+# Асинхронный доступ к базе данных (db.Database)
+db = None
+
+def initialize_db(database):
+    global db
+    db = database
 
-def initialize_db(connection, db_cursor):
-    global conn, cursor
-    conn = connection
-    cursor = db_cursor
+# Последний день (ММДД) каждого знака зодиака
+ZODIAC_DATES = [
+    (120, 'Козерог'), (219, 'Водолей'), (321, 'Рыбы'), (420, 'Овен'),
+    (521, 'Телец'), (621, 'Близнецы'), (723, 'Рак'), (823, 'Лев'),
+    (923, 'Дева'), (1023, 'Весы'), (1122, 'Скорпион'), (1222, 'Стрелец'), (1231, 'Козерог')
+]
+# Все 12 знаков без повторов
+ZODIAC_SIGNS = list(dict.fromkeys(name for _, name in ZODIAC_DATES))
 
 # Функция для определения знака зодиака
 def get_zodiac_sign(day, month):
-    zodiac_signs = [
-        (120, 'Козерог'), (219, 'Водолей'), (321, 'Рыбы'), (420, 'Овен'),
-        (521, 'Телец'), (621, 'Близнецы'), (723, 'Рак'), (823, 'Лев'),
-        (923, 'Дева'), (1023, 'Весы'), (1122, 'Скорпион'), (1222, 'Стрелец'), (1231, 'Козерог')
-    ]
     date = month * 100 + day
-    for zodiac_date, zodiac_name in zodiac_signs:
+    for zodiac_date, zodiac_name in ZODIAC_DATES:
         if date <= zodiac_date:
             return zodiac_name
     return 'Козерог'
 
-# Главная клавиатура с проверкой подписки
-def main_menu_keyboard(user_id):
+# Две готовые главные клавиатуры: с кнопкой премиума и без неё
+def _build_main_menu(with_premium_button):
     buttons = [
         ['🃏 Карта дня', '📜 История'],
-        ['📰 Новости', '⚙️ Настройки']
+        ['📰 Новости', '⚙️ Настройки'],
+        ['🔍 Поиск карты']
     ]
-
-    cursor.execute("SELECT 1 FROM subscriptions WHERE user_id = ?", (user_id,))
-    is_premium = cursor.fetchone()
-
-    if not is_premium:
+    if with_premium_button:
         buttons.append(['💎 Премиум-доступ'])
-
     buttons.append(['👤 Личный кабинет'])
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True)
 
+MAIN_MENU = _build_main_menu(with_premium_button=True)
+MAIN_MENU_PREMIUM = _build_main_menu(with_premium_button=False)
+
+# Главная клавиатура с проверкой подписки (через кэш подписок)
+async def main_menu_keyboard(user_id=None):
+    if user_id and await subscriptions.is_premium(user_id):
+        return MAIN_MENU_PREMIUM
+    return MAIN_MENU
+
 # Функция личного кабинета
 async def personal_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global conn, cursor
     user = update.message.from_user
     logger.info(f"Пользователь {user.username} ({user.id}) запросил личный кабинет.")
 
-    cursor.execute("""
+    user_data = await db.fetchone("""
         SELECT nickname, birth_date, zodiac_sign,
                total_cards, straight_cards, reversed_cards,
                consecutive_days
         FROM users WHERE user_id = ?
     """, (user.id,))
-    user_data = cursor.fetchone()
 
     if user_data:
         nickname, birth_date, zodiac_sign, total_cards, straight_cards, reversed_cards, consecutive_days = user_data
 
         # Проверка подписки
-        cursor.execute("SELECT expires_at FROM subscriptions WHERE user_id = ?", (user.id,))
-        subscription = cursor.fetchone()
-        if subscription:
-            expires_at = subscription[0]
-            sub_status = f"✅ Премиум до {expires_at}"
+        expires_at = await subscriptions.get_expires_at(user.id)
+        if subscriptions.is_active(expires_at):
+            sub_status = f"✅ Премиум до {format_epoch(expires_at, '%Y-%m-%d')}"
+        elif expires_at:
+            sub_status = f"⌛ Премиум истёк {format_epoch(expires_at, '%Y-%m-%d')}"
         else:
             sub_status = "🔒 Без подписки"
 
@@ -82,11 +90,11 @@ async def personal_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Перевёрнутых карт: {reversed_cards}\n"
             f"Дней подряд: {consecutive_days}\n\n"
             f"💼 *Подписка:* {sub_status}",
-            reply_markup=main_menu_keyboard(user.id),
+            reply_markup=await main_menu_keyboard(user.id),
             parse_mode='Markdown'
         )
     else:
         await update.message.reply_text(
             "Вы ещё не настроили свой профиль. Используйте команду /start.",
-            reply_markup=main_menu_keyboard(user.id)
+            reply_markup=await main_menu_keyboard(user.id)
         )
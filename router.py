@@ -0,0 +1,247 @@
+"""
+Таблица маршрутов бота: команда или надпись кнопки -> обработчик.
+
+Маршруты объявляются один раз при старте и ставятся в приложение двумя обработчиками:
+один на все команды, один на весь текст. Внутри — поиск по словарю вместо цепочки if/elif
+и перебора CommandHandler'ов. Если ключ объявлен дважды, побеждает маршрут с большим
+приоритетом (при равном — объявленный раньше), проигравший попадает в отчёт check().
+
+Для каждого маршрута считаются вызовы, ошибки и гистограмма времени обработки.
+"""
+import logging
+import time
+from datetime import datetime
+
+from telegram import Chat, Message, MessageEntity, Update, User
+from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, filters
+
+logger = logging.getLogger(__name__)
+
+COMMAND = 'command'
+TEXT = 'text'
+FALLBACK = '*'
+# Верхние границы корзин гистограммы, в секундах (последняя корзина — всё, что дольше)
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RouteStats:
+    __slots__ = ('calls', 'errors', 'total_time', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, elapsed, failed=False):
+        self.calls += 1
+        self.errors += failed
+        self.total_time += elapsed
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """
+        Верхняя граница корзины, в которую попадает доля fraction вызовов (None — дольше последней).
+        """
+        if not self.calls:
+            return 0.0
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= fraction * self.calls:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else None
+        return None
+
+    def summary(self):
+        def bound(value):
+            return f">{LATENCY_BUCKETS[-1]:g} с" if value is None else f"≤{value * 1000:g} мс"
+        average = self.total_time / self.calls * 1000 if self.calls else 0.0
+        return (
+            f"{self.calls} вызовов, ошибок {self.errors}, в среднем {average:.0f} мс, "
+            f"p50 {bound(self.percentile(0.5))}, p95 {bound(self.percentile(0.95))}"
+        )
+
+
+class Route:
+    __slots__ = ('kind', 'key', 'callback', 'priority', 'order', 'stats')
+
+    def __init__(self, kind, key, callback, priority, order):
+        self.kind = kind
+        self.key = key
+        self.callback = callback
+        self.priority = priority
+        self.order = order
+        self.stats = RouteStats()
+
+    @property
+    def name(self):
+        if self.key == FALLBACK:
+            return "прочие команды" if self.kind == COMMAND else "прочий текст"
+        return f"/{self.key}" if self.kind == COMMAND else f"«{self.key}»"
+
+    def __repr__(self):
+        return f"Route({self.name} -> {getattr(self.callback, '__name__', self.callback)}, priority={self.priority})"
+
+
+class Router:
+    def __init__(self):
+        self._declared = []
+        self.commands = {}
+        self.labels = {}
+        self.shadowed = []  # (проигравший маршрут, победивший маршрут)
+        self.text_fallback = None
+        self.command_fallback = None
+        self._command_handler = None
+        self._text_handler = None
+
+    def _add(self, kind, key, callback, priority):
+        route = Route(kind, key, callback, priority, len(self._declared))
+        self._declared.append(route)
+        return route
+
+    def command(self, name, callback, priority=0):
+        return self._add(COMMAND, name.lower(), callback, priority)
+
+    def text(self, label, callback, priority=0):
+        return self._add(TEXT, label, callback, priority)
+
+    def fallback_text(self, callback):
+        self.text_fallback = Route(TEXT, FALLBACK, callback, 0, -1)
+
+    def fallback_command(self, callback):
+        self.command_fallback = Route(COMMAND, FALLBACK, callback, 0, -1)
+
+    def build(self):
+        """
+        Собирает словари маршрутов; вызывается один раз, после объявления всех маршрутов.
+        """
+        self.commands.clear()
+        self.labels.clear()
+        self.shadowed.clear()
+        for route in sorted(self._declared, key=lambda r: (-r.priority, r.order)):
+            table = self.commands if route.kind == COMMAND else self.labels
+            winner = table.setdefault(route.key, route)
+            if winner is not route:
+                self.shadowed.append((route, winner))
+
+    def routes(self):
+        extra = [r for r in (self.text_fallback, self.command_fallback) if r is not None]
+        return list(self.commands.values()) + list(self.labels.values()) + extra
+
+    async def _run(self, route, update, context):
+        started = time.perf_counter()
+        try:
+            result = await route.callback(update, context)
+        except Exception:
+            route.stats.observe(time.perf_counter() - started, failed=True)
+            raise
+        route.stats.observe(time.perf_counter() - started)
+        return result
+
+    async def handle_command(self, update, context):
+        text = update.message.text or ''
+        head, *args = text.split()
+        command, _, addressee = head[1:].partition('@')
+        if addressee and addressee.lower() != (context.bot.username or '').lower():
+            return  # команда другому боту в группе
+        route = self.commands.get(command.lower(), self.command_fallback)
+        if route is None:
+            return
+        context.args = args
+        return await self._run(route, update, context)
+
+    async def handle_text(self, update, context):
+        route = self.labels.get(update.message.text, self.text_fallback)
+        if route is None:
+            return
+        return await self._run(route, update, context)
+
+    def install(self, app, group=0):
+        """
+        Собирает таблицу и добавляет в приложение обработчики команд и текста.
+        Вызывать после обработчиков, которые должны перехватывать раньше (диалоги, фото).
+        """
+        self.build()
+        self._command_handler = MessageHandler(filters.COMMAND, self.handle_command)
+        app.add_handler(self._command_handler, group)
+        self._text_handler = MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text)
+        app.add_handler(self._text_handler, group)
+
+    def _probe(self, text):
+        entities = None
+        if text.startswith('/'):
+            entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split()[0]))]
+        message = Message(
+            message_id=0, date=datetime.now(), chat=Chat(0, Chat.PRIVATE),
+            from_user=User(0, 'probe', False), text=text, entities=entities,
+        )
+        return Update(0, message=message)
+
+    def _accepts(self, handler, text):
+        try:
+            return bool(handler.check_update(self._probe(text)))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _commands_of(handler):
+        if isinstance(handler, CommandHandler):
+            return set(handler.commands)
+        if isinstance(handler, ConversationHandler):
+            return set().union(*(Router._commands_of(h) for h in handler.entry_points))
+        return set()
+
+    def check(self, app, group=0):
+        """
+        Ищет недостижимые обработчики и маршруты. Возвращает список описаний проблем
+        (и пишет их в лог как предупреждения).
+        """
+        problems = [f"Маршрут {loser!r} перекрыт маршрутом {winner!r}" for loser, winner in self.shadowed]
+        problems += [
+            f"Маршрут {route.name}: надпись начинается с «/» и будет принята за команду"
+            for route in self.labels.values() if route.key.startswith('/')
+        ]
+
+        handlers = app.handlers.get(group, [])
+        position = handlers.index(self._text_handler) if self._text_handler in handlers else len(handlers)
+        command_position = handlers.index(self._command_handler) if self._command_handler in handlers else len(handlers)
+        for index, handler in enumerate(handlers):
+            if handler is self._text_handler or handler is self._command_handler:
+                continue
+            # Обработчики до роутера забирают себе команды и надписи роутера
+            if index < position:
+                for command in self._commands_of(handler) & set(self.commands):
+                    problems.append(f"Маршрут /{command} перехватывается раньше обработчиком {handler!r}")
+            # Роутер принимает любую команду, даже без маршрута — до следующих обработчиков команды не дойдут
+            if index > command_position:
+                commands = self._commands_of(handler)
+                if commands:
+                    listed = ", ".join(f"/{command}" for command in sorted(commands))
+                    problems.append(f"Обработчик {handler!r} стоит после роутера и недостижим для команд {listed}")
+                elif isinstance(handler, MessageHandler) and self._accepts(handler, '/probe'):
+                    problems.append(f"Обработчик {handler!r} стоит после роутера и недостижим для команд")
+            if not isinstance(handler, MessageHandler):
+                continue
+            for label in list(self.labels) + ['probe']:
+                if not self._accepts(handler, label):
+                    continue
+                if index < position and label in self.labels:
+                    problems.append(f"Маршрут «{label}» перехватывается раньше обработчиком {handler!r}")
+                elif index > position:
+                    # Роутер принимает любой текст без команды — до этого обработчика текст не дойдёт
+                    problems.append(f"Обработчик {handler!r} стоит после роутера и недостижим для текста «{label}»")
+                    break
+
+        for problem in problems:
+            logger.warning(problem)
+        return problems
+
+    def summary(self, limit=10):
+        busy = sorted((r for r in self.routes() if r.stats.calls), key=lambda r: -r.stats.calls)[:limit]
+        if not busy:
+            return "вызовов пока не было"
+        return "\n".join(f"{route.name}: {route.stats.summary()}" for route in busy)
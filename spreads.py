@@ -0,0 +1,285 @@
+"""
+Расклады из нескольких карт: «Прошлое — Настоящее — Будущее» и кельтский крест.
+
+Карты расклада собираются в одну картинку (одна загрузка вместо N).
+Готовые картинки лежат в дисковом LRU-кэше под именем-хэшем от набора карт,
+поэтому повторный расклад не рисуется заново, а благодаря telegram_files
+уходит по уже известному file_id.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow не установлен — расклад приходит только текстом
+    Image = ImageDraw = ImageFont = None
+
+import card_images
+import card_registry
+import telegram_files
+from config import IMAGE_CACHE_DIR, IMAGE_MAX_SIDE, IMAGE_QUALITY, SPREAD_CACHE_MAX_FILES
+from live_message import split_text
+
+logger = logging.getLogger(__name__)
+
+# Позиция: (название, столбец, строка, лежит поперёк). Столбцы и строки — в размерах карты.
+SPREADS = {
+    'three': {
+        'title': "Прошлое — Настоящее — Будущее",
+        'positions': [
+            ("Прошлое", 0, 0, False),
+            ("Настоящее", 1, 0, False),
+            ("Будущее", 2, 0, False),
+        ],
+    },
+    'celtic': {
+        'title': "Кельтский крест",
+        'positions': [
+            ("Ситуация", 1.45, 1, False),
+            ("Препятствие", 1.45, 1, True),
+            ("Основа", 1.45, 2, False),
+            ("Прошлое", 0, 1, False),
+            ("Возможное", 1.45, 0, False),
+            ("Ближайшее будущее", 2.9, 1, False),
+            ("Вы сами", 4.3, 2.5, False),
+            ("Окружение", 4.3, 1.5, False),
+            ("Надежды и страхи", 4.3, 0.5, False),
+            ("Итог", 4.3, -0.5, False),
+        ],
+    },
+}
+SPREAD_ALIASES = {'3': 'three', 'три': 'three', 'крест': 'celtic', 'кельтский': 'celtic'}
+
+# Размер карты до масштабирования (как у картинок в images/), отступы — в долях ширины карты
+CARD_SIZE = (350, 600)
+GAP = 0.12
+MARGIN = 0.15
+BACKGROUND = (36, 22, 54)
+RENDER_VERSION = 1
+
+BASE_DIR = None
+cache = None
+
+
+def draw_spread(kind):
+    """
+    Случайные карты без повторов для расклада: [(карта, перевёрнута), ...].
+    """
+    names = random.sample(card_registry.NAMES, len(SPREADS[kind]['positions']))
+    return [(name, random.random() < 0.5) for name in names]
+
+
+def spread_key(kind, draw):
+    """
+    Адрес картинки в кэше: хэш от вида расклада и набора (картинка, положение).
+    """
+    parts = [f"v{RENDER_VERSION}", str(IMAGE_MAX_SIDE), str(IMAGE_QUALITY), kind]
+    parts += [f"{card_registry.BY_NAME[name].image_file}:{int(is_reversed)}" for name, is_reversed in draw]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _layout(kind):
+    """
+    Пиксельная раскладка: масштаб подбирается так, чтобы картинка влезла в IMAGE_MAX_SIDE.
+    Возвращает (размер холста, размер карты, [(x, y) левого верхнего угла ячейки]).
+    """
+    positions = SPREADS[kind]['positions']
+    min_col = min(p[1] for p in positions)
+    min_row = min(p[2] for p in positions)
+    cols = max(p[1] for p in positions) - min_col + 1
+    rows = max(p[2] for p in positions) - min_row + 1
+
+    def canvas_for(card_w, card_h):
+        gap, margin = GAP * card_w, MARGIN * card_w
+        return (round(cols * (card_w + gap) - gap + 2 * margin),
+                round(rows * (card_h + gap) - gap + 2 * margin))
+
+    scale = min(1.0, IMAGE_MAX_SIDE / max(canvas_for(*CARD_SIZE)))
+    card_w, card_h = round(CARD_SIZE[0] * scale), round(CARD_SIZE[1] * scale)
+    gap, margin = GAP * card_w, MARGIN * card_w
+    cells = [
+        (round(margin + (col - min_col) * (card_w + gap)), round(margin + (row - min_row) * (card_h + gap)))
+        for _, col, row, _ in positions
+    ]
+    return canvas_for(card_w, card_h), (card_w, card_h), cells
+
+
+def _card_face(name, is_reversed, size):
+    path = card_images.image_path(card_registry.BY_NAME[name].image_file)
+    if os.path.exists(path):
+        with Image.open(path) as source:
+            face = source.convert('RGB').resize(size, Image.LANCZOS)
+    else:
+        # Картинки нет — рисуем пустую рамку, чтобы расклад не ломался
+        face = Image.new('RGB', size, (70, 52, 96))
+        ImageDraw.Draw(face).rectangle([0, 0, size[0] - 1, size[1] - 1], outline=(200, 180, 230), width=3)
+    return face.rotate(180) if is_reversed else face
+
+
+def render_spread(kind, draw, path):
+    """
+    Рисует расклад в JPEG по пути path (синхронно, вызывать из потока).
+    """
+    canvas_size, card_size, cells = _layout(kind)
+    canvas = Image.new('RGB', canvas_size, BACKGROUND)
+    painter = ImageDraw.Draw(canvas)
+    radius = max(10, card_size[0] // 10)
+    try:
+        font = ImageFont.load_default(size=radius)
+    except TypeError:  # Pillow < 10.1: только встроенный мелкий шрифт
+        font = ImageFont.load_default()
+    for number, ((name, is_reversed), (x, y), position) in enumerate(
+            zip(draw, cells, SPREADS[kind]['positions']), start=1):
+        face = _card_face(name, is_reversed, card_size)
+        if position[3]:
+            face = face.rotate(90, expand=True)
+            x += (card_size[0] - face.width) // 2
+            y += (card_size[1] - face.height) // 2
+        canvas.paste(face, (x, y))
+        # Номер позиции в углу карты
+        painter.ellipse([x + 4, y + 4, x + 4 + 2 * radius, y + 4 + 2 * radius], fill=(250, 240, 255))
+        painter.text((x + 4 + radius, y + 4 + radius), str(number), fill=BACKGROUND, font=font, anchor='mm')
+
+    tmp_path = path + '.tmp'
+    canvas.save(tmp_path, 'JPEG', quality=IMAGE_QUALITY, optimize=True)
+    os.replace(tmp_path, path)
+
+
+class SpreadCache:
+    """
+    Дисковый LRU-кэш картинок раскладов: <каталог>/<ключ>.jpg.
+    Порядок использования ведётся в памяти; при запуске он восстанавливается по mtime файлов
+    (то есть по времени отрисовки). Сами файлы при попадании не трогаются — иначе telegram_files
+    считал бы их изменившимися. При превышении max_files удаляются самые давно использованные.
+    on_evict(path) — корутина, которой сообщают об удалённом файле.
+    """
+
+    def __init__(self, directory, max_files: int = 2000, on_evict=None):
+        self.directory = directory
+        self.max_files = max_files
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.jpg'):
+                entries.append((entry.stat().st_mtime, entry.name[:-4]))
+        self._index = OrderedDict((key, None) for _, key in sorted(entries))
+        self._rendering = {}
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.jpg")
+
+    def _touch(self, key):
+        self._index[key] = None
+        self._index.move_to_end(key)
+
+    def _evict(self):
+        evicted = []
+        while len(self._index) > self.max_files:
+            key, _ = self._index.popitem(last=False)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.evicted += 1
+            evicted.append(self.path(key))
+        return evicted
+
+    async def get_or_render(self, kind, draw):
+        """
+        Путь к картинке расклада; рисует её в потоке, если в кэше нет.
+        Одновременные запросы одного расклада ждут одну отрисовку.
+        """
+        key = spread_key(kind, draw)
+        path = self.path(key)
+        if key in self._index and os.path.exists(path):
+            self.hits += 1
+            self._touch(key)
+            return path
+
+        pending = self._rendering.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = self._rendering[key] = asyncio.ensure_future(asyncio.to_thread(render_spread, kind, draw, path))
+            pending.add_done_callback(lambda _: self._rendering.pop(key, None))
+        else:
+            self.hits += 1
+        await asyncio.shield(pending)
+        self._touch(key)
+        for evicted in self._evict():
+            if self.on_evict is not None:
+                await self.on_evict(evicted)
+        return path
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return (
+            f"в кэше {len(self._index)}, попаданий {self.hits}, промахов {self.misses}, "
+            f"доля попаданий {self.hit_rate:.0%}, вытеснено {self.evicted}"
+        )
+
+
+def initialize_spreads(base_directory):
+    global BASE_DIR, cache
+    BASE_DIR = base_directory
+    if Image is not None:
+        # Вытесненный расклад больше не отправится — его file_id не храним ни в базе, ни в памяти
+        cache = SpreadCache(
+            os.path.join(base_directory, IMAGE_CACHE_DIR, 'spreads'), SPREAD_CACHE_MAX_FILES,
+            on_evict=telegram_files.forget,
+        )
+
+
+def spread_text(kind, draw):
+    lines = [f"🔮 {SPREADS[kind]['title']}\n"]
+    for number, ((name, is_reversed), position) in enumerate(zip(draw, SPREADS[kind]['positions']), start=1):
+        meaning = card_registry.BY_NAME[name].meaning(is_reversed)
+        orientation = "Перевёрнутая" if is_reversed else "Прямая"
+        lines.append(f"{number}. {position[0]}: {name} ({orientation})\n{meaning}\n")
+    return '\n'.join(lines)
+
+
+async def spread_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /spread — расклад из трёх карт, /spread celtic (или «крест») — кельтский крест.
+    """
+    user = update.message.from_user
+    arg = (context.args[0].lower() if context.args else 'three')
+    kind = SPREAD_ALIASES.get(arg, arg)
+    if kind not in SPREADS:
+        await update.message.reply_text("Доступные расклады: /spread — три карты, /spread celtic — кельтский крест.")
+        return
+    logger.info(f"Пользователь {user.username} ({user.id}) запросил расклад {kind}.")
+
+    draw = draw_spread(kind)
+    chat_id = update.message.chat_id
+    if cache is not None:
+        started = time.perf_counter()
+        try:
+            path = await cache.get_or_render(kind, draw)
+            await telegram_files.send_photo(context.bot, chat_id, path, content_addressed=True,
+                                            caption=f"🔮 {SPREADS[kind]['title']}")
+        except Exception as e:
+            logger.error(f"Не удалось отрисовать расклад {kind}: {e}")
+        else:
+            logger.info(f"Расклад {kind} отправлен за {time.perf_counter() - started:.3f} с.")
+
+    text = spread_text(kind, draw)
+    while text:
+        part, text = split_text(text)
+        await update.message.reply_text(part)
@@ -0,0 +1,137 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from db import day_start_epoch
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class SubscriptionCache:
+    """
+    Кэш срока подписки (subscriptions.expires_at) по user_id.
+    Чтение идёт через кэш, запись — через set()/invalidate() из мест, где подписка меняется.
+    Отсутствие подписки тоже кэшируется, чтобы отрисовка меню не ходила в базу.
+    """
+
+    def __init__(self, db, ttl: float = 600.0, max_size: int = 10000):
+        self.db = db
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (expires_at, загружено_в)
+        # user_id -> [поколение, сколько чтений из базы идёт]; только для ключей, которые сейчас читаются
+        self._reading = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return _MISSING
+        expires_at, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            del self._entries[user_id]
+            return _MISSING
+        self._entries.move_to_end(user_id)
+        return expires_at
+
+    def _changed(self, user_id):
+        reading = self._reading.get(user_id)
+        if reading is not None:
+            reading[0] += 1
+
+    def _store(self, user_id, expires_at):
+        self._entries[user_id] = (expires_at, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, user_id, expires_at):
+        self._changed(user_id)
+        self._store(user_id, expires_at)
+
+    def invalidate(self, user_id):
+        self._changed(user_id)
+        self._entries.pop(user_id, None)
+
+    async def get_expires_at(self, user_id):
+        expires_at = self._lookup(user_id)
+        if expires_at is not _MISSING:
+            self.hits += 1
+            return expires_at
+        self.misses += 1
+        reading = self._reading.setdefault(user_id, [0, 0])
+        generation = reading[0]
+        reading[1] += 1
+        try:
+            row = await self.db.fetchone("SELECT expires_at FROM subscriptions WHERE user_id = ?", (user_id,))
+        finally:
+            reading[1] -= 1
+            if not reading[1]:
+                del self._reading[user_id]
+        expires_at = row[0] if row else None
+        # Пока шёл запрос, подписку могли изменить (set/invalidate) — тогда прочитанное уже устарело
+        if reading[0] == generation:
+            self._store(user_id, expires_at)
+        return expires_at
+
+    async def is_premium(self, user_id) -> bool:
+        expires_at = await self.get_expires_at(user_id)
+        return is_active(expires_at)
+
+
+def is_active(expires_at) -> bool:
+    # Подписка действует до конца дня expires_at включительно
+    return expires_at is not None and expires_at >= day_start_epoch(datetime.now().date())
+
+
+cache = None
+
+
+def initialize_subscriptions(db, ttl: float = 600.0, max_size: int = 10000):
+    global cache
+    cache = SubscriptionCache(db, ttl=ttl, max_size=max_size)
+
+
+async def get_expires_at(user_id):
+    return await cache.get_expires_at(user_id)
+
+
+async def is_premium(user_id) -> bool:
+    return await cache.is_premium(user_id)
+
+
+async def iter_active_subscribers(db, chunk_size: int = 500):
+    """
+    Асинхронно отдаёт user_id действующих подписчиков по возрастанию срока подписки.
+    Строки читаются порциями по chunk_size с keyset-пагинацией по (expires_at, user_id) —
+    это и есть порядок индекса idx_subscriptions_expires_at (user_id — rowid), так что
+    истёкшие подписки не просматриваются, а память не растёт с числом подписчиков.
+    """
+    # Идентификаторы пользователей Telegram положительные: (сегодня, 0) — позиция перед первой действующей
+    last = (day_start_epoch(datetime.now().date()), 0)
+    while True:
+        rows = await db.fetchall(
+            "SELECT expires_at, user_id FROM subscriptions WHERE (expires_at, user_id) > (?, ?) "
+            "ORDER BY expires_at, user_id LIMIT ?",
+            (*last, chunk_size)
+        )
+        for _, user_id in rows:
+            yield user_id
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+
+async def count_subscriptions(db):
+    """
+    Возвращает (действующих, истёкших) подписок; оба подсчёта идут по индексу expires_at.
+    Строки без срока (только уведомления через /subscribe) не считаются ни там, ни там.
+    """
+    today_start = day_start_epoch(datetime.now().date())
+    active = await db.fetchone("SELECT COUNT(*) FROM subscriptions WHERE expires_at >= ?", (today_start,))
+    expired = await db.fetchone("SELECT COUNT(*) FROM subscriptions WHERE expires_at < ?", (today_start,))
+    return active[0], expired[0]
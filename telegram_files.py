@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    """
+    file_id картинок, уже загруженных в Telegram (таблица telegram_files).
+    Первая отправка файла загружает байты и запоминает file_id самого большого размера фото,
+    следующие ссылаются на него. Если файл на диске изменился (размер или mtime) или Telegram
+    больше не принимает file_id, картинка загружается заново. Для файлов с именем-хэшем от содержимого
+    (content_addressed, например расклады) размер и mtime не сверяются: такое имя — всегда те же байты.
+    """
+
+    def __init__(self, db, base_dir):
+        self.db = db
+        self.base_dir = base_dir
+        self._entries = {}  # path -> (file_id, size, mtime)
+        self._locks = {}
+        self._loaded = False
+        self.hits = 0
+        self.uploads = 0
+        self.invalidated = 0
+        self.bytes_uploaded = 0
+
+    def key(self, image_path):
+        return os.path.relpath(image_path, self.base_dir).replace(os.sep, '/')
+
+    async def load(self):
+        rows = await self.db.fetchall("SELECT path, file_id, size, mtime FROM telegram_files")
+        self._entries = {path: (file_id, size, mtime) for path, file_id, size, mtime in rows}
+        self._loaded = True
+
+    def _lookup(self, key, stat, content_addressed=False):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        file_id, size, mtime = entry
+        if not content_addressed and (size != stat.st_size or mtime != int(stat.st_mtime)):
+            return None
+        return file_id
+
+    async def _forget(self, key):
+        self._entries.pop(key, None)
+        await self.db.execute("DELETE FROM telegram_files WHERE path = ?", (key,))
+
+    async def forget(self, image_path):
+        """
+        Забывает file_id картинки, которой больше не будет на диске (например, вытесненного расклада).
+        """
+        key = self.key(image_path)
+        self._locks.pop(key, None)
+        if self._loaded and key not in self._entries:
+            return
+        await self._forget(key)
+
+    async def _upload(self, bot, chat_id, image_path, key, stat, **kwargs):
+        with open(image_path, 'rb') as photo:
+            message = await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+        self.uploads += 1
+        self.bytes_uploaded += stat.st_size
+        if message is not None and getattr(message, 'photo', None):
+            file_id = message.photo[-1].file_id
+            self._entries[key] = (file_id, stat.st_size, int(stat.st_mtime))
+            await self.db.execute(
+                "INSERT OR REPLACE INTO telegram_files (path, file_id, size, mtime, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+                (key, file_id, stat.st_size, int(stat.st_mtime), int(time.time()))
+            )
+        return message
+
+    async def send_photo(self, bot, chat_id, image_path, content_addressed=False, **kwargs):
+        """
+        Отправляет картинку по file_id, если он известен, иначе загружает файл.
+        Возвращает Message или None, если файла нет.
+        """
+        if not self._loaded:
+            await self.load()
+        try:
+            stat = os.stat(image_path)
+        except FileNotFoundError:
+            return None
+        key = self.key(image_path)
+
+        file_id = self._lookup(key, stat, content_addressed)
+        if file_id is None:
+            # Одновременные первые отправки одного файла ждут одну загрузку
+            lock = self._locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                file_id = self._lookup(key, stat, content_addressed)
+                if file_id is None:
+                    return await self._upload(bot, chat_id, image_path, key, stat, **kwargs)
+
+        try:
+            message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except BadRequest as e:
+            text = str(e).lower()
+            if 'file' not in text and 'identifier' not in text:
+                raise
+            logger.warning(f"Telegram не принял file_id для {key} ({e}), загружаем заново.")
+            self.invalidated += 1
+            await self._forget(key)
+            return await self._upload(bot, chat_id, image_path, key, stat, **kwargs)
+        self.hits += 1
+        return message
+
+    def summary(self):
+        return (
+            f"известно {len(self._entries)}, отправок по file_id {self.hits}, загрузок {self.uploads} "
+            f"({self.bytes_uploaded / 1024:.0f} КБ), заменено недействительных {self.invalidated}"
+        )
+
+
+cache = None
+
+
+def initialize_telegram_files(db, base_dir):
+    global cache
+    cache = FileIdCache(db, base_dir)
+
+
+async def send_photo(bot, chat_id, image_path, content_addressed=False, **kwargs):
+    return await cache.send_photo(bot, chat_id, image_path, content_addressed, **kwargs)
+
+
+async def forget(image_path):
+    await cache.forget(image_path)
+
+
+async def warm_up(bot, chat_id, image_paths, delay: float = 0.5):
+    """
+    Загружает в Telegram ещё не загруженные картинки, отправляя их в chat_id
+    (и сразу удаляя сообщения). Возвращает (загружено, уже было, нет файла).
+    """
+    if not cache._loaded:
+        await cache.load()
+    uploaded = known = missing = 0
+    for image_path in dict.fromkeys(image_paths):
+        try:
+            stat = os.stat(image_path)
+        except FileNotFoundError:
+            missing += 1
+            continue
+        if cache._lookup(cache.key(image_path), stat) is not None:
+            known += 1
+            continue
+        message = await cache.send_photo(bot, chat_id, image_path, disable_notification=True)
+        uploaded += 1
+        try:
+            await bot.delete_message(chat_id, message.message_id)
+        except BadRequest as e:
+            logger.warning(f"Не удалось удалить сообщение прогрева: {e}")
+        await asyncio.sleep(delay)
+    return uploaded, known, missing
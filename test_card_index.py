@@ -0,0 +1,38 @@
+import pytest
+
+import card_index
+
+
+def names(query, **kwargs):
+    return [card.name for card, _ in card_index.search(query, **kwargs)]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('Сметрь', 'Смерть'),
+    ('Бшаня', 'Башня'),
+    ('Жирца', 'Жрица'),
+    ('короле пент', 'Королева Пентаклей'),
+])
+def test_misspelled_name_is_found_first(query, expected):
+    assert names(query)[0] == expected
+
+
+def test_short_transposition_uses_edit_distance_despite_weak_trigram_hit():
+    # По триграммам «сметрь» слабо похоже на «смело»; «смерть» находит только редакционное расстояние
+    similar = card_index.similar_words('сметрь')
+    assert similar['смерть'] > similar.get('смело', 0)
+
+
+@pytest.mark.parametrize('query', ['да', 'нет', 'как дела', 'помогите', 'работа', 'е'])
+def test_free_text_without_card_name_finds_nothing(query):
+    assert names(query, whole_name=True) == []
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('шут', 'Шут'),
+    ('колесо фортуны', 'Колесо Фортуны'),
+    ('хочу карту смерть', 'Смерть'),
+    ('Сметрь', 'Смерть'),
+])
+def test_free_text_with_card_name_finds_it(query, expected):
+    assert names(query, whole_name=True)[0] == expected
@@ -0,0 +1,93 @@
+"""
+Параллельная обработка апдейтов с сохранением порядка для каждого пользователя.
+
+Апдейты разных пользователей обрабатываются одновременно (не больше max_concurrent_updates),
+апдейты одного пользователя — строго по очереди под его asyncio.Lock. Поэтому
+context.user_data и проверка daily_card_date не гоняются, а долгий AI-совет
+одного пользователя не задерживает нажатия остальных.
+
+Замок берётся до общего лимита: апдейты, ждущие своего пользователя,
+не занимают места тех, кто мог бы обрабатываться прямо сейчас. Но общий лимит начатых
+апдейтов (семафор базового класса) их считает, поэтому у одного пользователя в работе и
+в очереди не больше max_user_updates апдейтов — лишние отбрасываются, чтобы один
+пользователь, засыпающий бота нажатиями, не занял все места.
+"""
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update):
+    """
+    Чей это апдейт: id пользователя, а если его нет — id чата (None — порядок не важен).
+    """
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    return chat.id if chat is not None else None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    __slots__ = ('_running', '_locks', 'max_user_updates', 'active', 'processed', 'waited', 'dropped')
+
+    def __init__(self, max_concurrent_updates: int, max_queued_updates: int = 0, max_user_updates: int = 8):
+        # Семафор базового класса ограничивает все начатые апдейты (в работе и ждущие замка),
+        # свой — только те, что уже обрабатываются
+        super().__init__(max_concurrent_updates + max_queued_updates)
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}  # ключ -> [замок, сколько апдейтов его держат или ждут]
+        self.max_user_updates = max_user_updates
+        self.active = 0
+        self.processed = 0
+        self.waited = 0
+        self.dropped = 0
+
+    async def do_process_update(self, update, coroutine):
+        key = ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        elif entry[1] >= self.max_user_updates:
+            self.dropped += 1
+            coroutine.close()
+            logger.warning(f"Апдейт {update.update_id} от {key} отброшен: уже {entry[1]} в очереди у этого пользователя.")
+            return
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                self.waited += 1
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def _run(self, coroutine):
+        async with self._running:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def summary(self):
+        return (
+            f"обработано {self.processed}, сейчас {self.active}, "
+            f"пользователей в работе {len(self._locks)}, ждали своей очереди {self.waited}, отброшено {self.dropped}"
+        )
@@ -0,0 +1,203 @@
+"""
+Ограниченное хранилище context.user_data в памяти.
+
+Application держит user_data каждого, кто хоть раз писал боту, и никогда не забывает.
+Здесь вместо этого:
+  UserState      — компактная запись (__slots__) для известных ключей, прочие — в отдельном словаре;
+  UserStateStore — LRU на max_users записей с временем простоя ttl секунд; вытесненный
+                   пользователь уходит в базу через SQLitePersistence.evict_user и при следующем
+                   апдейте читается обратно (refresh_user_data);
+  TaroApplication — Application с этим хранилищем вместо defaultdict.
+"""
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from types import MappingProxyType
+
+from telegram import Update
+from telegram.ext import Application
+
+KNOWN_KEYS = ('daily_card_date', 'daily_card', 'card_message_id', 'nickname')
+_KNOWN = frozenset(KNOWN_KEYS)
+
+
+class UserState(MutableMapping):
+    """
+    user_data одного пользователя. Ведёт себя как dict; известные ключи лежат в слотах.
+    """
+    __slots__ = KNOWN_KEYS + ('_extra', '_touched')
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        self._touched = time.monotonic()
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in _KNOWN:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _KNOWN:
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _KNOWN:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+        if not self._extra:
+            self._extra = None
+
+    def __iter__(self):
+        for key in KNOWN_KEYS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(hasattr(self, key) for key in KNOWN_KEYS) + len(self._extra or ())
+
+    def __repr__(self):
+        return f"UserState({dict(self)!r})"
+
+
+def deep_size(value):
+    """
+    Примерный объём в памяти: сам объект и вложенные строки, числа, словари и списки.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, UserState):
+        return size + sum(deep_size(v) for v in value.values()) + (sys.getsizeof(value._extra) if value._extra else 0)
+    if isinstance(value, dict):
+        return size + sum(deep_size(k) + deep_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return size + sum(deep_size(v) for v in value)
+    return size
+
+
+class UserStateStore(OrderedDict):
+    """
+    user_id -> UserState в порядке последнего обращения. Новая запись создаётся при обращении
+    (как у defaultdict); сверх max_users и после ttl секунд простоя записи вытесняются.
+    """
+
+    def __init__(self, max_users, ttl, on_evict=None, can_evict=None):
+        super().__init__()
+        self.max_users = max_users
+        self.ttl = ttl
+        # on_evict(user_id, state) — сохранить вытесняемого; can_evict(user_id) — можно ли его вытеснять сейчас
+        self.on_evict = on_evict
+        self.can_evict = can_evict
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __missing__(self, user_id):
+        # Место освобождаем до вставки, чтобы не вытеснить саму новую запись
+        self.evict(reserve=1)
+        state = UserState()
+        self[user_id] = state
+        self.created += 1
+        return state
+
+    def __getitem__(self, user_id):
+        state = super().__getitem__(user_id)
+        if user_id in self:
+            self.move_to_end(user_id)
+            state._touched = time.monotonic()
+        return state
+
+    def _drop(self, user_id):
+        state = super().pop(user_id)
+        if self.on_evict is not None:
+            self.on_evict(user_id, state)
+
+    def evict(self, reserve=0):
+        """
+        Вытесняет самых давних пользователей: сверх max_users (оставляя reserve мест) и простоявших дольше ttl.
+        """
+        deadline = time.monotonic() - self.ttl
+        kept = []
+        while self:
+            user_id, state = next(iter(self.items()))
+            over = len(self) + len(kept) + reserve > self.max_users
+            if not over and state._touched > deadline:
+                break
+            if self.can_evict is not None and not self.can_evict(user_id):
+                # Данные ещё не переданы в хранилище — подержим запись до следующего раза
+                kept.append((user_id, super().pop(user_id)))
+                continue
+            self._drop(user_id)
+            self.evicted += 1
+            self.expired += not over
+        # Невытесненные возвращаем в начало очереди, на их прежнее место
+        for user_id, state in reversed(kept):
+            super().__setitem__(user_id, state)
+            self.move_to_end(user_id, last=False)
+
+    def memory_usage(self):
+        return sum(deep_size(state) for state in self.values()) + sys.getsizeof(self)
+
+    def summary(self):
+        usage = self.memory_usage()
+        average = usage / len(self) if self else 0
+        return (
+            f"в памяти {len(self)} из {self.max_users}, ~{usage / 1024:.0f} КБ ({average:.0f} Б на пользователя), "
+            f"создано {self.created}, вытеснено {self.evicted} (по простою {self.expired})"
+        )
+
+
+class TaroApplication(Application):
+    """
+    Application, у которого user_data хранится в UserStateStore.
+    Параметры передаются через ApplicationBuilder().application_class(TaroApplication, kwargs={...}).
+    """
+    __slots__ = ('user_states', '_active_users')
+
+    def __init__(self, *, max_users: int, user_ttl: float, **kwargs):
+        super().__init__(**kwargs)
+        self._active_users = {}  # user_id -> сколько его апдейтов сейчас обрабатывается
+        self.user_states = UserStateStore(
+            max_users, user_ttl, on_evict=self._store_evicted, can_evict=self._can_evict,
+        )
+        self._user_data = self.user_states
+        self.user_data = MappingProxyType(self.user_states)
+
+    async def process_update(self, update):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            return await super().process_update(update)
+        self._active_users[user.id] = self._active_users.get(user.id, 0) + 1
+        try:
+            return await super().process_update(update)
+        finally:
+            self._active_users[user.id] -= 1
+            if not self._active_users[user.id]:
+                del self._active_users[user.id]
+
+    def _can_evict(self, user_id):
+        # Нельзя вытеснять пользователя, чей апдейт сейчас обрабатывается (обработчик пишет
+        # в его запись), и того, чьи изменения Application ещё не передал в persistence:
+        # при передаче вместо его данных создалась бы пустая запись
+        return user_id not in self._active_users and user_id not in self._user_ids_to_be_updated_in_persistence
+
+    def _store_evicted(self, user_id, state):
+        if self.persistence is not None and self.persistence.store_data.user_data:
+            self.persistence.evict_user(user_id, state)
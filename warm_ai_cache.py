@@ -0,0 +1,202 @@
+"""
+Прогрев кэша AI-советов: все карты × положение × знак зодиака (12 знаков и «неизвестен») × варианты.
+
+Готовые тексты пишутся в ai_advice_cache, откуда их берёт ежедневная рассылка.
+Сама таблица служит контрольной точкой: уже сохранённые и не устаревшие
+комбинации пропускаются, так что прерванный прогрев можно просто запустить заново.
+
+Запуск:           python warm_ai_cache.py --concurrency 4
+Только список:    python warm_ai_cache.py --dry-run
+На стенде:        python warm_ai_cache.py --stub --db /tmp/warm.db --stub-latency 0.2
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import statistics
+import time
+
+import card_registry
+from config import DB_PATH, DB_STORAGE_MODE, AI_CACHE_VARIANTS, AI_CACHE_TTL, AI_MAX_CONCURRENCY
+from db import Database
+from migrations import run_migrations
+from personal_account import ZODIAC_SIGNS
+
+logger = logging.getLogger('warm_ai_cache')
+
+
+def all_combinations(variants):
+    """
+    (карта, перевёрнута, знак, вариант) для всех карт; знак None — «неизвестен».
+    """
+    return itertools.product(card_registry.NAMES, (False, True), ZODIAC_SIGNS + [None], range(variants))
+
+
+async def cached_keys(db, ttl):
+    rows = await db.fetchall(
+        "SELECT card, is_reversed, zodiac_sign, variant FROM ai_advice_cache WHERE created_at >= ?",
+        (int(time.time() - ttl) if ttl else 0,)
+    )
+    return {tuple(row) for row in rows}
+
+
+class WarmupStats:
+    def __init__(self, total, skipped, todo):
+        self.total = total
+        self.skipped = skipped
+        self.todo = todo
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+
+    def progress(self):
+        return f"{self.done + self.failed}/{self.todo} (ошибок {self.failed}, повторов {self.retries})"
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        lines = [
+            f"Комбинаций всего: {self.total}, уже в кэше: {self.skipped}, к генерации: {self.todo}",
+            f"Сгенерировано: {self.done}, ошибок: {self.failed}, повторов: {self.retries}, за {elapsed:.1f} с",
+            f"Доля завершённых: {(self.skipped + self.done) / self.total:.1%} от всего пространства"
+            + (f", {self.done / self.todo:.1%} от запланированного" if self.todo else ""),
+            f"Токены: prompt {self.prompt_tokens}, completion {self.completion_tokens}, "
+            f"всего {self.prompt_tokens + self.completion_tokens}",
+        ]
+        if len(self.latencies) >= 2:
+            q = statistics.quantiles(self.latencies, n=100, method='inclusive')
+            lines.append(f"Задержка: p50 {q[49]:.3f} с, p95 {q[94]:.3f} с, p99 {q[98]:.3f} с, max {max(self.latencies):.3f} с")
+        return '\n'.join(lines)
+
+
+async def warm(db, combos, stats, concurrency, retries, progress_every):
+    import ai_utils
+    from ai_cache import AdviceCache
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def generate(card, is_reversed, sign, variant):
+        messages = ai_utils.build_messages(card, card_registry.BY_NAME[card].info, sign, is_reversed)
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await ai_utils.request_completion(messages)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                stats.retries += 1
+                logger.warning(f"{card}/{sign}: {e}, повтор через {2 ** attempt} с")
+                await asyncio.sleep(2 ** attempt)
+                continue
+            stats.latencies.append(time.perf_counter() - started)
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                stats.prompt_tokens += usage.prompt_tokens or 0
+                stats.completion_tokens += usage.completion_tokens or 0
+            text = response.choices[0].message.content.strip()
+            await db.execute(
+                "INSERT OR REPLACE INTO ai_advice_cache (card, is_reversed, zodiac_sign, variant, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*AdviceCache.key(card, is_reversed, sign), variant, text, int(time.time()))
+            )
+            return
+
+    async def worker():
+        while True:
+            combo = await queue.get()
+            if combo is None:
+                return
+            try:
+                await generate(*combo)
+                stats.done += 1
+            except Exception as e:
+                stats.failed += 1
+                logger.error(f"Не удалось сгенерировать {combo}: {e}")
+            finished = stats.done + stats.failed
+            if progress_every and finished % progress_every == 0:
+                logger.info(f"Прогрев: {stats.progress()}")
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for combo in combos:
+            await queue.put(combo)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def run(args):
+    server = None
+    if args.stub:
+        from ai_stub_server import StubAIServer
+        server = StubAIServer(latency=args.stub_latency, jitter=args.stub_latency / 5, fail_rate=args.stub_fail_rate)
+        await server.start()
+        os.environ['AI_BASE_URL'] = server.base_url
+
+    db = Database(args.db, mode=DB_STORAGE_MODE)
+    db.run_sync(run_migrations)
+    try:
+        existing = await cached_keys(db, AI_CACHE_TTL)
+        combos = list(all_combinations(args.variants))
+        total = len(combos)
+        combos = [c for c in combos if (c[0], int(c[1]), c[2] or '', c[3]) not in existing]
+        skipped = total - len(combos)
+        if args.limit:
+            combos = combos[:args.limit]
+        stats = WarmupStats(total, skipped, len(combos))
+
+        if args.dry_run:
+            print(f"Комбинаций всего: {total}, уже в кэше: {skipped}, к генерации: {len(combos)}")
+            for card, is_reversed, sign, variant in combos:
+                print(f"{card}\t{'перевёрнутая' if is_reversed else 'прямая'}\t{sign or 'неизвестен'}\t{variant}")
+            return
+
+        try:
+            await warm(db, combos, stats, args.concurrency, args.retries, args.progress_every)
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            logger.warning("Прогрев прерван, сохранённое останется в кэше — запустите снова, чтобы продолжить")
+            raise
+        finally:
+            print(stats.report())
+            import ai_utils
+            await ai_utils.close_ai_client()
+    finally:
+        await db.stop_writer()
+        db.close()
+        if server is not None:
+            print(f"Запросов к стенду: {server.requests}, одновременно не больше {server.max_in_flight}")
+            await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=None, help=f"база (по умолчанию {DB_PATH})")
+    parser.add_argument('--concurrency', type=int, default=AI_MAX_CONCURRENCY,
+                        help=f"параллельных запросов, не больше AI_MAX_CONCURRENCY ({AI_MAX_CONCURRENCY})")
+    parser.add_argument('--variants', type=int, default=AI_CACHE_VARIANTS)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--limit', type=int, default=0, help="сгенерировать не больше N комбинаций")
+    parser.add_argument('--progress-every', type=int, default=50)
+    parser.add_argument('--dry-run', action='store_true', help="только показать, что осталось сгенерировать")
+    parser.add_argument('--stub', action='store_true', help="поднять ai_stub_server в этом же процессе")
+    parser.add_argument('--stub-latency', type=float, default=0.2)
+    parser.add_argument('--stub-fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    if not 1 <= args.concurrency <= AI_MAX_CONCURRENCY:
+        # Запросы к модели всё равно идут через семафор ai_utils на AI_MAX_CONCURRENCY
+        parser.error(f"--concurrency должен быть от 1 до AI_MAX_CONCURRENCY ({AI_MAX_CONCURRENCY})")
+    if args.stub and args.db is None:
+        parser.error("с --stub укажите отдельную базу через --db, чтобы тексты стенда не попали в рабочий кэш")
+    args.db = args.db or DB_PATH
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
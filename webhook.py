@@ -0,0 +1,152 @@
+"""
+Получение апдейтов через webhook вместо long polling.
+
+Telegram сам присылает каждый апдейт POST-запросом на WEBHOOK_URL. Запросы принимает
+mini_http: проверяется заголовок X-Telegram-Bot-Api-Secret-Token, тело кладётся в очередь
+и сразу отвечается 200. Разбор JSON в Update и передачу в Application делают
+WEBHOOK_WORKERS фоновых задач. Дальше апдейт обрабатывается так же, как при polling.
+Если очередь переполнена, отвечаем 503, и Telegram повторит апдейт позже.
+
+WEBHOOK_QUEUE ограничивает только принятые, но ещё не разобранные тела. Разобранный апдейт
+уходит в Application.update_queue, у которой предела нет; сколько апдейтов обрабатывается
+и ждёт одновременно, ограничивает обработчик апдейтов (update_processing.py: CONCURRENT_UPDATES,
+CONCURRENT_UPDATES_QUEUE и CONCURRENT_UPDATES_PER_USER на пользователя). Сверх WEBHOOK_MAX_CONNECTIONS
+соединения не ждут, а получают 503; молчащие дольше WEBHOOK_IDLE_TIMEOUT закрываются.
+
+Бот слушает WEBHOOK_LISTEN:WEBHOOK_PORT по HTTP; TLS снимает reverse proxy (nginx и т. п.),
+который проксирует WEBHOOK_URL на этот адрес.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from urllib.parse import urlparse
+
+from telegram import Update
+
+from mini_http import serve, write_response
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class WebhookServer:
+    def __init__(self, app, path='/', secret_token=None, workers: int = 4, queue_size: int = 1000,
+                 max_connections: int = 40, idle_timeout: float = 60.0):
+        self.app = app
+        self.path = path
+        # Без заданного секрета берём случайный: set_webhook всё равно передаёт его Telegram при каждом запуске
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.workers = workers
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._server = None
+        self._tasks = []
+        self.received = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.invalid = 0
+
+    async def handle(self, request, writer):
+        if request.path.split('?', 1)[0] != self.path:
+            write_response(writer, 404, {'ok': False})
+            return
+        if request.method != 'POST':
+            write_response(writer, 405, {'ok': False})
+            return
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            write_response(writer, 403, {'ok': False})
+            return
+        try:
+            self._queue.put_nowait(request.body)
+        except asyncio.QueueFull:
+            self.overloaded += 1
+            write_response(writer, 503, {'ok': False})
+            return
+        self.received += 1
+        write_response(writer, 200, {'ok': True})
+
+    async def _worker(self):
+        while True:
+            body = await self._queue.get()
+            try:
+                update = Update.de_json(json.loads(body), self.app.bot)
+                await self.app.update_queue.put(update)
+            except Exception as e:
+                self.invalid += 1
+                logger.warning(f"Не удалось разобрать апдейт из webhook: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await serve(self.handle, host, port, max_connections=self.max_connections,
+                                   idle_timeout=self.idle_timeout)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Разбираем уже принятое, чтобы Telegram не считал эти апдейты доставленными зря
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def summary(self):
+        return (
+            f"принято {self.received}, в очереди {self._queue.qsize()}, отклонено по секрету {self.rejected}, "
+            f"503 из-за очереди {self.overloaded}, не разобрано {self.invalid}"
+        )
+
+
+async def run_webhook(app, server: WebhookServer, url, host, port):
+    """
+    Запускает бота в режиме webhook и работает до SIGINT/SIGTERM
+    (тот же порядок запуска и остановки, что у Application.run_polling).
+    """
+    if not url.startswith('https://'):
+        raise ValueError("Для режима webhook задайте WEBHOOK_URL — публичный https-адрес")
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        listening = await server.start(host, port)
+        await app.bot.set_webhook(
+            url, secret_token=server.secret_token, max_connections=server.max_connections,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook {url} -> {host}:{listening}, соединений до {server.max_connections}, "
+                    f"разборщиков {server.workers}.")
+        await app.start()
+        try:
+            await stop.wait()
+        finally:
+            # Webhook не снимаем: пока бот перезапускается, Telegram копит апдейты у себя
+            await server.stop()
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+    finally:
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def webhook_path(url):
+    return urlparse(url).path or '/'